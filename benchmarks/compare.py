@@ -0,0 +1,47 @@
+"""
+Compares two benchmark results written by benchmarks.run.
+
+Example:
+    python -m benchmarks.compare bench_results/<before>.json bench_results/<after>.json
+"""
+import argparse
+import json
+
+
+def flatten(metrics, prefix=""):
+    """Flattens nested results into {"case.metric": value}, runs are keyed by their audio duration."""
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for run in value:
+                label = f"{run.get('audio_seconds')}s" + (".chunked" if run.get("chunked") else "")
+                flat.update(flatten({k: v for k, v in run.items() if k not in ("audio_seconds", "chunked")}, f"{name}.{label}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares two benchmark results")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"{(before['commit'] or '?')[:12]} -> {(after['commit'] or '?')[:12]}")
+
+    before_metrics, after_metrics = flatten(before["results"]), flatten(after["results"])
+    for name in sorted(set(before_metrics) & set(after_metrics)):
+        old, new = before_metrics[name], after_metrics[name]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else ""
+        print(f"{name:<50} {old:>12.4g} {new:>12.4g} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
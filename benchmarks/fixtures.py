@@ -0,0 +1,53 @@
+import os
+import wave
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+
+
+def synthetic_speech(duration_s, sampling_rate=SAMPLING_RATE, seed=0):
+    """
+    Speech-like test signal: bursts of harmonic tones with a syllable-rate
+    envelope, separated by pauses, over a low noise floor. Deterministic for a seed.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sampling_rate)) / sampling_rate
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sampling_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    # 3 s of speech, 1 s of pause
+    pauses = (t % 4) < 3
+    signal = 0.3 * voiced * envelope * pauses + 0.003 * rng.standard_normal(len(t))
+    return signal.astype(np.float32)
+
+
+def write_wav(path, samples, sampling_rate=SAMPLING_RATE):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sampling_rate)
+        f.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+def audio_fixture(fixtures_dir, duration_s):
+    """Returns the path of a synthetic WAV fixture of the given duration, created on first use."""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f"synthetic_{int(duration_s)}s.wav")
+    if not os.path.exists(path):
+        write_wav(path, synthetic_speech(duration_s))
+    return path
+
+
+def rss_feed(n_items, base_url):
+    """An RSS feed with n_items episodes whose enclosures point to base_url."""
+    items = "".join(
+        f"<item><title>Episode {i}</title><description>Description of episode {i}</description>"
+        f"<enclosure url=\"{base_url}/files/episode_{i}.mp3\" type=\"audio/mpeg\" length=\"1000000\"/></item>"
+        for i in range(n_items)
+    )
+    return (
+        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+        f"<rss version=\"2.0\"><channel><title>Benchmark feed</title>{items}</channel></rss>"
+    ).encode()
@@ -0,0 +1,106 @@
+"""
+Import-time budget of the entry points.
+
+Every module is imported in a fresh interpreter, which reports how long the
+import took and which heavy backends it pulled in. A module fails the check if
+its import is slower than the budget or loads one of the lazily imported
+dependencies (torch, transformers, groq, pytubefix, streamlit) it is not
+allowed to: those must only be imported when the code path that needs them
+first runs. The Streamlit app is the only entry point that may import streamlit.
+
+Exits with status 1 if any module fails, so it can gate a CI job.
+
+Examples:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget 0.5 --top 15
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# Maximum import seconds per entry point, --budget overrides it
+BUDGET = 1.0
+LAZY_MODULES = ["torch", "transformers", "groq", "httpx", "pytubefix", "streamlit"]
+# Entry point -> the lazy modules it may import
+ENTRY_POINTS = {
+    "src.transcription.service": [],
+    "src.jobs.worker": [],
+    "src.cli": [],
+    "streamlit_app": ["streamlit"],
+}
+
+
+def forbidden_modules(module):
+    """The lazy modules an entry point must not import (all of them for other modules)."""
+    allowed = ENTRY_POINTS.get(module, [])
+    return [name for name in LAZY_MODULES if name not in allowed]
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr, top=10):
+    """The slowest imports of a `python -X importtime` report, as (cumulative seconds, module) pairs."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def measure(module, lazy_modules=LAZY_MODULES, top=10):
+    """
+    Imports a module in a fresh interpreter.
+
+    Returns:
+        dict: import seconds, the lazy modules it loaded and its slowest imports
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(module=module, lazy=list(lazy_modules))],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        return {"module": module, "error": process.stderr.strip().splitlines()[-1]}
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["module"] = module
+    result["slowest"] = [{"module": name, "seconds": seconds} for seconds, name in parse_importtime(process.stderr, top)]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time budget of the entry points")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--budget", type=float, default=BUDGET, help="Maximum import seconds per module")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        result = measure(module, forbidden_modules(module), top=args.top)
+        if "error" in result:
+            print(f"FAIL {module}: {result['error']}")
+            failed = True
+            continue
+        problems = []
+        if result["seconds"] > args.budget:
+            problems.append(f"over the {args.budget:.2f}s budget")
+        if result["loaded"]:
+            problems.append(f"imports {', '.join(result['loaded'])}")
+        failed = failed or bool(problems)
+        print(f"{'FAIL' if problems else 'ok  '} {module}: {result['seconds']:.3f}s" + (f" ({'; '.join(problems)})" if problems else ""))
+        for entry in result["slowest"]:
+            print(f"       {entry['seconds']:.3f}s {entry['module']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Benchmarks of the download and transcription hot paths.
+
+Every case runs in a fresh process, so its peak RSS and load times are not
+affected by the other cases. The Groq API, the RSS feed and the episode files are
+served by a local stub server, the local model runs a tiny Whisper checkpoint on CPU.
+Results are written as JSON, keyed by git commit, to compare them across commits.
+
+Examples:
+    python -m benchmarks.run
+    python -m benchmarks.run --cases imports api download feed --output bench_results/
+    python -m benchmarks.run --cases local --durations 30 300 --model openai/whisper-tiny
+"""
+import argparse
+import functools
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from benchmarks.fixtures import audio_fixture
+from benchmarks.stubs import StubServer
+
+CASES = ["imports", "model_load", "local", "api", "download", "feed", "streaming"]
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process, in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def bench_imports(args):
+    from benchmarks.import_time import ENTRY_POINTS, forbidden_modules, measure
+
+    results = {module: measure(module, forbidden_modules(module)) for module in ENTRY_POINTS}
+    # Only the seconds are compared across commits, the lazy modules are checked by import_time itself
+    return {module: {"seconds": result.get("seconds"), "loaded": result.get("loaded", [])} for module, result in results.items()}
+
+
+def bench_model_load(args):
+    from src.transcription.local_model import Model
+
+    model = Model(args.model, device="cpu", backend=args.backend, use_cache=False)
+    start = time.perf_counter()
+    model.load_model()
+    return {"model": args.model, "backend": args.backend, "load_seconds": time.perf_counter() - start}
+
+
+def bench_local(args):
+    from src.transcription.local_model import Model
+
+    model = Model(args.model, device="cpu", backend=args.backend, use_cache=False)
+    model.load_model()
+    runs = []
+    for duration in args.durations:
+        path = audio_fixture(args.fixtures_dir, duration)
+        start = time.perf_counter()
+        model.transcribe_long_form([path])
+        elapsed = time.perf_counter() - start
+        runs.append({"audio_seconds": duration, "seconds": elapsed, "rtf": elapsed / duration})
+    return {"model": args.model, "backend": args.backend, "runs": runs}
+
+
+def bench_api(args):
+    from src.transcription import groq_client
+    from src.transcription.api_model import ApiModel
+
+    runs = []
+    with StubServer(api_latency_s=args.api_latency, rate_limit_every=args.rate_limit_every) as stub:
+        os.environ.setdefault("GROQ_API_KEY", "benchmark")
+        groq_client.reset_client()
+        groq_client.get_client(base_url=stub.base_url)
+        model = ApiModel(model_name="whisper-large-v3", return_text_only=True, use_cache=False)
+        for duration in args.durations:
+            path = audio_fixture(args.fixtures_dir, duration)
+            for chunked in [False, True]:
+                requests_before = stub.api_requests
+                start = time.perf_counter()
+                if chunked:
+                    # Small chunks, so that the stub sees as many requests as a long episode would
+                    model.transcribe_chunked(path, max_chunk_s=60, max_workers=4)
+                else:
+                    model.transcribe(path)
+                elapsed = time.perf_counter() - start
+                runs.append({
+                    "audio_seconds": duration,
+                    "chunked": chunked,
+                    "seconds": elapsed,
+                    "rtf": elapsed / duration,
+                    "requests": stub.api_requests - requests_before,
+                })
+        groq_client.reset_client()
+    return {"api_latency_s": args.api_latency, "rate_limit_every": args.rate_limit_every, "runs": runs}
+
+
+def bench_download(args):
+    from src.downloader.downloader import download_file
+
+    file_size = args.download_mb * 1024 * 1024
+    with StubServer(file_size=file_size) as stub, tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "episode.mp3")
+        start = time.perf_counter()
+        download_file(f"{stub.base_url}/files/episode.mp3", path)
+        elapsed = time.perf_counter() - start
+    return {"bytes": file_size, "seconds": elapsed, "mb_per_second": file_size / 1024 / 1024 / elapsed}
+
+
+def bench_feed(args):
+    from src.downloader.feed_cache import FeedCache, parse_feed
+
+    with StubServer(feed_items=args.feed_items) as stub:
+        start = time.perf_counter()
+        parse_feed(io.BytesIO(stub.feed))
+        parse_seconds = time.perf_counter() - start
+
+        cache = FeedCache(ttl=0)
+        feed_url = f"{stub.base_url}/feed.xml"
+        start = time.perf_counter()
+        cache.get(feed_url)
+        fetch_seconds = time.perf_counter() - start
+        # Expired entry, revalidated with a conditional GET answered by a 304
+        start = time.perf_counter()
+        cache.get(feed_url)
+        revalidate_seconds = time.perf_counter() - start
+    return {
+        "items": args.feed_items,
+        "feed_bytes": len(stub.feed),
+        "parse_seconds": parse_seconds,
+        "fetch_seconds": fetch_seconds,
+        "revalidate_seconds": revalidate_seconds,
+    }
+
+
+def bench_streaming(args):
+    """Time to the first text and to the whole result, downloading then transcribing vs transcribing while downloading."""
+    from src.downloader.downloader import download_file
+    from src.transcription import groq_client
+    from src.transcription.service import API_METHOD, transcribe_audio
+    from src.transcription.streaming import transcribe_while_downloading
+
+    with open(audio_fixture(args.fixtures_dir, args.stream_duration), "rb") as f:
+        content = f.read()
+    results = {"audio_seconds": args.stream_duration, "download_seconds": args.stream_download_seconds}
+    with StubServer(api_latency_s=args.api_latency, file_content=content, bytes_per_second=len(content) / args.stream_download_seconds) as stub:
+        os.environ.setdefault("GROQ_API_KEY", "benchmark")
+        groq_client.reset_client()
+        groq_client.get_client(base_url=stub.base_url)
+        for mode in ["sequential", "streaming"]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "episode.wav")
+                download = functools.partial(download_file, f"{stub.base_url}/files/episode.wav", path)
+                first_text = []
+                start = time.perf_counter()
+
+                def _on_partial(partial):
+                    if not first_text:
+                        first_text.append(time.perf_counter() - start)
+
+                if mode == "streaming":
+                    transcribe_while_downloading(download, path, API_METHOD, "whisper-large-v3", options={}, on_partial=_on_partial)
+                else:
+                    download()
+                    transcribe_audio(path, API_METHOD, "whisper-large-v3", options={"chunked": True}, on_partial=_on_partial)
+                results[mode] = {"first_text_seconds": first_text[0], "seconds": time.perf_counter() - start}
+        groq_client.reset_client()
+    return results
+
+
+def run_case(case, args):
+    """Runs a case in the current (fresh) process. Its transcription cache is a throwaway directory."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["TRANSCRIPTION_CACHE_DIR"] = cache_dir
+        start = time.perf_counter()
+        metrics = globals()[f"bench_{case}"](args)
+        metrics["wall_seconds"] = time.perf_counter() - start
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the download and transcription hot paths")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--durations", nargs="+", type=int, default=[30, 300, 1800], help="Seconds of synthetic audio")
+    parser.add_argument("--model", default="openai/whisper-tiny", help="Local checkpoint, tiny enough for CPU runs")
+    parser.add_argument("--backend", default="eager")
+    parser.add_argument("--api-latency", type=float, default=0.2, help="Seconds the stub API takes per request")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every n-th API request with a 429")
+    parser.add_argument("--download-mb", type=int, default=200)
+    parser.add_argument("--feed-items", type=int, default=5000)
+    parser.add_argument("--stream-duration", type=int, default=600, help="Seconds of audio of the streaming case")
+    parser.add_argument("--stream-download-seconds", type=float, default=20, help="Time the stub takes to serve the streaming case audio")
+    parser.add_argument("--fixtures-dir", default=os.path.join(tempfile.gettempdir(), "whisper-bench-fixtures"))
+    parser.add_argument("--output", default="bench_results", help="Directory of the JSON results")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "results": {},
+    }
+    for case in args.cases:
+        print(f"Running {case}...", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            try:
+                report["results"][case] = executor.submit(run_case, case, args).result()
+            except Exception as e:
+                report["results"][case] = {"error": repr(e)}
+        print(json.dumps(report["results"][case], indent=2), flush=True)
+
+    os.makedirs(args.output, exist_ok=True)
+    output_path = os.path.join(args.output, f"{(commit or 'unknown')[:12]}-{int(time.time())}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
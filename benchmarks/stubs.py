@@ -0,0 +1,136 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fixtures import rss_feed
+
+
+class StubServer:
+    """
+    Local HTTP server standing in for the Groq API, an RSS feed and episode files.
+
+    Routes:
+        POST /openai/v1/audio/transcriptions: verbose_json answer after api_latency_s.
+            The first requests are answered with the statuses of error_statuses, in order,
+            and then every rate_limit_every-th request with a 429. 429s carry a
+            Retry-After of retry_after_s
+        GET /feed.xml: a feed with feed_items episodes, with ETag support
+        GET /files/<name>: file_size bytes of a repeated pattern (or file_content), with Range support,
+            sent at bytes_per_second if set
+    """
+
+    def __init__(self, api_latency_s=0.2, rate_limit_every=0, feed_items=1000, file_size=50 * 1024 * 1024, file_content=None, bytes_per_second=None, error_statuses=(), retry_after_s=0.1):
+        self.api_latency_s = api_latency_s
+        self.rate_limit_every = rate_limit_every
+        self.error_statuses = list(error_statuses)
+        self.retry_after_s = retry_after_s
+        self.file_content = file_content
+        self.file_size = len(file_content) if file_content is not None else file_size
+        self.bytes_per_second = bytes_per_second
+        self.api_requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        self.feed = rss_feed(feed_items, self.base_url)
+        self.feed_etag = '"' + hashlib.sha1(self.feed).hexdigest() + '"'
+        # Repeated to file_size on the fly, so big files cost no memory
+        self._file_block = bytes(range(256)) * 4096
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub._lock:
+                    stub.api_requests += 1
+                    if stub.api_requests <= len(stub.error_statuses):
+                        status = stub.error_statuses[stub.api_requests - 1]
+                    elif stub.rate_limit_every and stub.api_requests % stub.rate_limit_every == 0:
+                        status = 429
+                    else:
+                        status = None
+                if status == 429:
+                    self._send(429, b'{"error": {"message": "rate limited"}}', "application/json", {"Retry-After": str(stub.retry_after_s)})
+                    return
+                if status is not None:
+                    self._send(status, b'{"error": {"message": "stub error"}}', "application/json")
+                    return
+                time.sleep(stub.api_latency_s)
+                body = json.dumps({
+                    "task": "transcribe",
+                    "language": "english",
+                    "duration": 10.0,
+                    "text": "stub transcription",
+                    "segments": [{"id": 0, "start": 0.0, "end": 10.0, "text": "stub transcription"}],
+                }).encode()
+                self._send(200, body, "application/json")
+
+            def do_GET(self):
+                if self.path == "/feed.xml":
+                    if self.headers.get("If-None-Match") == stub.feed_etag:
+                        self._send(304, b"", "application/rss+xml", {"ETag": stub.feed_etag})
+                    else:
+                        self._send(200, stub.feed, "application/rss+xml", {"ETag": stub.feed_etag})
+                elif self.path.startswith("/files/"):
+                    self._send_file()
+                else:
+                    self._send(404, b"", "text/plain")
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_file(self):
+                start = 0
+                match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                if match:
+                    start = int(match.group(1))
+                    if start >= stub.file_size:
+                        self._send(416, b"", "audio/mpeg")
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{stub.file_size - 1}/{stub.file_size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(stub.file_size - start))
+                self.end_headers()
+                position = start
+                block = stub._file_block
+                while position < stub.file_size:
+                    if stub.file_content is not None:
+                        chunk = stub.file_content[position: position + len(block)]
+                    else:
+                        # Same bytes at the same offsets whatever the Range start, so resumed
+                        # downloads are identical to full ones
+                        offset = position % len(block)
+                        chunk = block[offset: offset + min(len(block) - offset, stub.file_size - position)]
+                    self.wfile.write(chunk)
+                    position += len(chunk)
+                    if stub.bytes_per_second:
+                        time.sleep(len(chunk) / stub.bytes_per_second)
+
+        return Handler
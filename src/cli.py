@@ -0,0 +1,320 @@
+"""
+Headless batch transcription of a whole RSS feed, YouTube playlist/channel or local directory.
+
+Examples:
+    python -m src.cli feed https://example.com/feed.xml --output transcripts
+    python -m src.cli youtube https://www.youtube.com/playlist?list=... --method local --model openai/whisper-small
+    python -m src.cli youtube https://www.youtube.com/@channel --captions manual
+    python -m src.cli feed https://example.com/feed.xml --streaming
+    python -m src.cli dir ./downloads --output transcripts
+"""
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from src.downloader.downloader import download_audio_from_youtube, download_file, get_episode_file_name, get_session
+from src.downloader.feed_cache import get_feed_cache
+from src.transcription.backends import BACKENDS
+from src.transcription.service import API_METHOD, CAPTION_POLICIES, LOCAL_METHOD, caption_result, index_transcript, transcribe_audio
+from src.transcription.streaming import transcribe_while_downloading
+from src.utils.audio import is_derived_file, probe_duration
+from src.utils.metrics import start_metrics_server_from_env, trace
+from src.utils.subtitles import SubtitleStream, SubtitleWriter, format_jsonl, result_to_segments, result_to_subtitles
+from src.utils.utils import get_safe_file_name
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".mp4"}
+
+
+def unique_items(items, suffix):
+    """
+    Drops repeated sources and makes the ids unique, since an id names the outputs
+    and the download of an item. Colliding ids (episodes with the same title, files
+    with the same name and another extension) get suffix(item) appended.
+    """
+    sources = set()
+    items = [item for item in items if not (item["source"] in sources or sources.add(item["source"]))]
+    counts = Counter(item["id"] for item in items)
+    taken = set()
+    for item in items:
+        item_id = item["id"] if counts[item["id"]] == 1 else f"{item['id']}-{suffix(item)}"
+        base, n = item_id, 2
+        while item_id in taken:
+            item_id = f"{base}-{n}"
+            n += 1
+        taken.add(item_id)
+        item["id"] = item_id
+        if "filename" in item:
+            item["filename"] = item_id + os.path.splitext(item["filename"])[1]
+    return items
+
+
+def feed_items(feed_url, media_type="audio/mpeg"):
+    feed = get_feed_cache().get(feed_url, session=get_session())
+    items = []
+    for i, item in enumerate(feed["items"]):
+        if item["url"] is None or (media_type is not None and item["type"] != media_type):
+            continue
+        title = item["title"] or f"Episode {i+1}"
+        filename = get_episode_file_name(title, item["url"])
+        items.append({"id": os.path.splitext(filename)[0], "title": title, "kind": "podcast", "source": item["url"], "filename": filename})
+    # Stable across runs, unlike the position in the feed
+    return unique_items(items, lambda item: hashlib.sha1(item["source"].encode()).hexdigest()[:8])
+
+
+def youtube_items(url):
+    from pytubefix import Channel, Playlist, extract
+
+    if "list=" in url:
+        video_urls = Playlist(url).video_urls
+    elif "/@" in url or "/channel/" in url or "/c/" in url:
+        video_urls = Channel(url).video_urls
+    else:
+        video_urls = [url]
+    items = []
+    for video_url in video_urls:
+        video_id = extract.video_id(video_url)
+        items.append({"id": video_id, "title": video_url, "kind": "youtube", "source": video_url, "filename": f"{video_id}.mp3"})
+    return unique_items(items, lambda item: item["id"])
+
+
+def directory_items(path):
+    items = []
+    for name in sorted(os.listdir(path)):
+        stem, extension = os.path.splitext(name)
+        # Transcoded copies and speech-only audio written by earlier runs are not inputs
+        if extension.lower() in AUDIO_EXTENSIONS and not is_derived_file(name):
+            items.append({"id": get_safe_file_name(stem), "title": name, "kind": "file", "source": os.path.join(path, name)})
+    return unique_items(items, lambda item: os.path.splitext(item["source"])[1].lstrip(".").lower())
+
+
+def download_item(item, download_dir):
+    if item["kind"] == "file":
+        return item["source"]
+    file_path = os.path.join(download_dir, item["filename"])
+    if item["kind"] == "youtube":
+        if not os.path.exists(file_path):
+            download_audio_from_youtube(item["source"], file_path=file_path)
+        return file_path
+    download_file(item["source"], file_path)
+    return file_path
+
+
+def transcribe_item(item, audio_path, args, options, stats, download=None):
+    """
+    Transcribes an item, writing its .srt and .vtt subtitles while it is transcribed.
+    With a download function, the item is transcribed while it is downloaded to audio_path.
+
+    Returns:
+        the transcription result
+    """
+    base_path = os.path.join(args.output, item["id"])
+    with open(base_path + ".srt", "w", encoding="utf-8") as srt_file, open(base_path + ".vtt", "w", encoding="utf-8") as vtt_file:
+        stream = SubtitleStream(
+            [SubtitleWriter(srt_file, "srt", args.max_line_length), SubtitleWriter(vtt_file, "vtt", args.max_line_length)],
+            max_line_length=args.max_line_length,
+            max_duration=args.max_cue_seconds,
+        )
+        if download is not None:
+            result = transcribe_while_downloading(
+                download, audio_path, args.method, args.model, args.language,
+                return_text_only=False, options=options, stats=stats, on_partial=stream.add,
+            )
+        else:
+            result = transcribe_audio(
+                audio_path, args.method, args.model, args.language,
+                return_text_only=False, options=options, stats=stats, on_partial=stream.add,
+            )
+        stream.close()
+    return result
+
+
+def write_subtitles(item, result, args):
+    base_path = os.path.join(args.output, item["id"])
+    for subtitle_format in ["srt", "vtt"]:
+        with open(f"{base_path}.{subtitle_format}", "w", encoding="utf-8") as f:
+            f.write(result_to_subtitles(result, subtitle_format, args.max_line_length, max_duration=args.max_cue_seconds))
+
+
+def write_outputs(item, result, args):
+    index_transcript(result, item["source"], item["title"], item["kind"], args.method, args.model)
+    # The .jsonl file is written last, it marks the item as done
+    base_path = os.path.join(args.output, item["id"])
+    tmp_path = base_path + ".jsonl.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(format_jsonl(result_to_segments(result)))
+    os.replace(tmp_path, base_path + ".jsonl")
+
+
+def run_batch(items, args):
+    """
+    Downloads and transcribes the items, downloads running ahead of transcriptions
+    on their own pool. With --streaming, the transcription workers download the items
+    themselves while transcribing them. Subtitles are written as the items are
+    transcribed, and items with an existing .jsonl output are skipped.
+
+    Returns:
+        dict: counts and the audio seconds and wall seconds processed
+    """
+    os.makedirs(args.output, exist_ok=True)
+    os.makedirs(args.download_dir, exist_ok=True)
+    todo = [item for item in items if not os.path.exists(os.path.join(args.output, item["id"] + ".jsonl"))]
+    stats = {
+        "items": len(items), "skipped": len(items) - len(todo), "done": 0, "failed": 0,
+        "audio_seconds": 0.0, "vad_skipped_seconds": 0.0, "transcode_saved_bytes": 0, "transcode_seconds": 0.0,
+        "captioned": 0,
+    }
+    print(f"{len(items)} items, {stats['skipped']} already transcribed")
+
+    # Bounded, so downloads do not run arbitrarily far ahead of the transcriptions
+    downloaded = queue.Queue(maxsize=args.download_workers * 2)
+    stats_lock = threading.Lock()
+    options = {"backend": args.backend} if args.method == LOCAL_METHOD else {"chunked": args.chunked}
+    options["vad"] = args.vad
+    options["normalize"] = not args.no_normalize
+    options["word_timestamps"] = args.word_timestamps
+
+    def _download(item):
+        try:
+            # Videos whose captions pass the policy are neither downloaded nor transcribed
+            result = caption_result(item["source"], args.method, args.language, False, dict(options, captions=args.captions)) if item["kind"] == "youtube" else None
+            if result is not None:
+                write_subtitles(item, result, args)
+                write_outputs(item, result, args)
+                with stats_lock:
+                    stats["captioned"] += 1
+                print(f"{item['title']}: used YouTube captions")
+                return
+        except Exception as e:
+            logging.log(logging.WARNING, f"Captions of {item['title']} failed, transcribing the audio: {e}")
+        if args.streaming and item["kind"] != "file":
+            # Downloaded by the transcription worker, while it transcribes
+            downloaded.put((item, os.path.join(args.download_dir, item["filename"]), functools.partial(download_item, item, args.download_dir)))
+            return
+        try:
+            downloaded.put((item, download_item(item, args.download_dir), None))
+        except Exception as e:
+            logging.log(logging.ERROR, f"Download of {item['title']} failed: {e}")
+            downloaded.put((item, None, None))
+
+    def _transcribe_worker():
+        while True:
+            entry = downloaded.get()
+            if entry is None:
+                return
+            item, audio_path, download = entry
+            if audio_path is None:
+                with stats_lock:
+                    stats["failed"] += 1
+                continue
+            item_stats = {}
+            try:
+                with trace(item["id"]) as item_trace:
+                    result = transcribe_item(item, audio_path, args, options, item_stats, download)
+                if args.trace:
+                    with open(os.path.join(args.output, item["id"] + ".trace.json"), "w", encoding="utf-8") as f:
+                        json.dump(item_trace.to_dict(), f, indent=2)
+                write_outputs(item, result, args)
+            except Exception as e:
+                logging.log(logging.ERROR, f"Transcription of {item['title']} failed: {e}")
+                with stats_lock:
+                    stats["failed"] += 1
+                continue
+            try:
+                audio_seconds = probe_duration(audio_path)
+            except Exception as e:
+                # The transcript is written, only the throughput misses this item
+                logging.log(logging.WARNING, f"Could not probe the duration of {item['title']}: {e}")
+                audio_seconds = 0.0
+            with stats_lock:
+                stats["done"] += 1
+                stats["audio_seconds"] += audio_seconds
+                for key in ["vad_skipped_seconds", "transcode_saved_bytes", "transcode_seconds"]:
+                    stats[key] += item_stats.get(key, 0)
+            skipped = f" ({item_stats['vad_skipped_seconds']:.0f}s of silence skipped)" if "vad_skipped_seconds" in item_stats else ""
+            first_text = f" (first text after {item_stats['first_partial_seconds']:.1f}s)" if "first_partial_seconds" in item_stats else ""
+            print(f"[{stats['done'] + stats['failed']}/{len(todo)}] {item['title']}{skipped}{first_text}")
+
+    start = time.monotonic()
+    transcribe_workers = [threading.Thread(target=_transcribe_worker, daemon=True) for _ in range(args.transcribe_workers)]
+    for worker in transcribe_workers:
+        worker.start()
+    with ThreadPoolExecutor(max_workers=args.download_workers) as executor:
+        list(executor.map(_download, todo))
+    for _ in transcribe_workers:
+        downloaded.put(None)
+    for worker in transcribe_workers:
+        worker.join()
+    stats["wall_seconds"] = time.monotonic() - start
+    return stats
+
+
+def print_summary(stats):
+    audio_hours = stats["audio_seconds"] / 3600
+    wall_hours = stats["wall_seconds"] / 3600
+    print(
+        f"Transcribed {stats['done']} items ({stats['skipped']} skipped, {stats['failed']} failed): "
+        f"{audio_hours:.2f} audio hours in {stats['wall_seconds']:.0f}s"
+    )
+    if stats["captioned"]:
+        print(f"Used YouTube captions for {stats['captioned']} videos")
+    if stats["transcode_saved_bytes"]:
+        print(f"Transcoding saved {stats['transcode_saved_bytes'] / 1e6:.1f} MB in {stats['transcode_seconds']:.0f}s")
+    if stats["vad_skipped_seconds"]:
+        print(f"Skipped {stats['vad_skipped_seconds'] / 3600:.2f} hours of silence")
+    if wall_hours > 0:
+        print(f"Throughput: {audio_hours / wall_hours:.1f} audio-hours per wall-clock hour")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk transcription of feeds, playlists and directories")
+    parser.add_argument("source_type", choices=["feed", "youtube", "dir"])
+    parser.add_argument("source", help="RSS feed URL, YouTube playlist/channel/video URL or directory")
+    parser.add_argument("--output", default="transcripts", help="Directory of the .jsonl and .srt outputs")
+    parser.add_argument("--download-dir", default="downloads")
+    parser.add_argument("--method", choices=["api", "local"], default="api")
+    parser.add_argument("--model", help="Model name (default whisper-large-v3 for the API, openai/whisper-small locally)")
+    parser.add_argument("--language", default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Local inference backend")
+    parser.add_argument("--chunked", action="store_true", help="Split long files for the API")
+    parser.add_argument("--vad", action="store_true", help="Skip silent parts before transcribing")
+    parser.add_argument("--no-normalize", action="store_true", help="Do not transcode to 16 kHz mono first")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--transcribe-workers", type=int, default=4, help="Files transcribed at the same time, local windows are batched across them")
+    parser.add_argument("--media-type", default="audio/mpeg", help="Enclosure type of feed episodes")
+    parser.add_argument("--captions", choices=CAPTION_POLICIES, default=None, help="Use YouTube captions instead of transcribing when available: manual only, or auto-generated too")
+    parser.add_argument("--word-timestamps", action="store_true", help="Time subtitles from word timestamps")
+    parser.add_argument("--max-line-length", type=int, default=42, help="Subtitle line length, cues have at most 2 lines")
+    parser.add_argument("--max-cue-seconds", type=float, default=6.0, help="Maximum duration of a subtitle cue")
+    parser.add_argument("--trace", action="store_true", help="Also write the timings of every stage to <id>.trace.json")
+    parser.add_argument("--streaming", action="store_true", help="Transcribe feed and YouTube items while they are downloaded, by the transcription workers (--vad is ignored)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    start_metrics_server_from_env()
+    args.method = API_METHOD if args.method == "api" else LOCAL_METHOD
+    if args.model is None:
+        args.model = "whisper-large-v3" if args.method == API_METHOD else "openai/whisper-small"
+
+    if args.source_type == "feed":
+        items = feed_items(args.source, args.media_type)
+    elif args.source_type == "youtube":
+        items = youtube_items(args.source)
+    else:
+        items = directory_items(args.source)
+
+    print_summary(run_batch(items, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,79 @@
-from pytubefix import YouTube
 import logging, io
 import requests
 import xml.etree.ElementTree as ET
 import os
 from urllib.parse import urlparse
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 
+from src.downloader.feed_cache import get_feed_cache, raw_read_errors
+from src.utils.metrics import span
+from src.utils.subtitles import parse_srt
 from src.utils.utils import get_safe_file_name
-import streamlit as st
+
+
+def _youtube(youtube_url, **kwargs):
+    # pytubefix is imported on first use, podcast and upload sessions never need it
+    from pytubefix import YouTube
+
+    return YouTube(youtube_url, **kwargs)
+
+
+def download_audio_from_youtube(youtube_url: str, file_path=None, download_dir='downloads', progress_callback=None) -> str:
+    """
+    Streams the audio track of a YouTube video straight to a file, so memory
+    does not depend on the length of the video.
+
+    Args:
+        youtube_url (str): URL of the video
+        file_path (str): Destination path (default: the safe video title in download_dir)
+        download_dir (str): Directory used when file_path is not given
+        progress_callback (callable): Called with (downloaded_size, total_size) after every chunk
+
+    Returns:
+        str: path of the downloaded file
+    """
+    logging.getLogger("pytube").setLevel(logging.INFO)
+
+    def _on_progress(stream, chunk, bytes_remaining):
+        progress_callback(stream.filesize - bytes_remaining, stream.filesize)
+
+    yt = _youtube(youtube_url, on_progress_callback=_on_progress if progress_callback else None)
+    video = yt.streams.filter(only_audio=True).first()
+    if file_path is None:
+        file_path = os.path.join(download_dir, get_safe_file_name(yt.title + ".mp3"))
+
+    # Written under a temporary name so an interrupted download is never mistaken for a complete one
+    part_path = file_path + ".part"
+    with span("download", source="youtube") as s:
+        with open(part_path, "wb") as f:
+            video.stream_to_buffer(f)
+        os.replace(part_path, file_path)
+        s.set(bytes=os.path.getsize(file_path))
+    logging.log(logging.INFO, f"Saved {yt.title} to {file_path}")
+    return file_path
 
 def download_mp3_from_youtube(youtube_url: str, save_file=False, download_dir='downloads', filename=None) -> bytes:
+    if save_file:
+        file_path = os.path.join(download_dir, filename) if filename is not None else None
+        return download_audio_from_youtube(youtube_url, file_path=file_path, download_dir=download_dir)
+
+    # Holds the whole track in memory, prefer download_audio_from_youtube for long videos
     logging.getLogger("pytube").setLevel(logging.INFO)
-    yt = YouTube(youtube_url)
+    yt = _youtube(youtube_url)
     video = yt.streams.filter(only_audio=True).first()
     buffer = io.BytesIO()
     video.stream_to_buffer(buffer)
-    buffer.seek(0)
-    if save_file:
-        if filename is None:
-            filename = get_safe_file_name(yt.title + ".mp3")
-            file_path = download_dir + '/' + filename
-        with open(file_path, "wb") as f:
-            f.write(buffer.read())
-            buffer.close()
-            logging.log(logging.INFO, f"Saved {filename}")
-            return file_path
-    else:
-        logging.log(logging.INFO, f"Downloaded {yt.title} to buffer")
-        return buffer.read()
+    logging.log(logging.INFO, f"Downloaded {yt.title} to buffer")
+    return buffer.getvalue()
 
 def download_captions_from_youtube(youtube_url: str, captions_format='txt', save_path=None, language=None):
     assert captions_format in ['txt', 'srt'], f"Invalid captions format. Possible values are 'txt' or 'srt', got {captions_format}"
     
-    yt = YouTube(youtube_url)
+    yt = _youtube(youtube_url)
     if language is None:
         language = list(yt.captions.keys())[0]
 
@@ -47,7 +88,203 @@ def download_captions_from_youtube(youtube_url: str, captions_format='txt', save
 
     return caption
 
-def download_podcast_from_podcastindex_url(feed_url, media_type="audio/mpeg", download_dir=None, selected_indices=None):
+def caption_language(code):
+    """Language of a caption track code: "en" for "en", "en-GB" and the auto-generated "a.en"."""
+    return code.split(".")[-1].split("-")[0].lower()
+
+def select_caption_track(captions, language=None, allow_auto=False):
+    """
+    Caption quality policy: manual tracks are preferred, auto-generated ones
+    (codes starting with "a.") are only accepted with allow_auto, and the track
+    must be in language unless it is None.
+
+    Returns:
+        The selected pytubefix Caption, or None
+    """
+    candidates = [caption for caption in captions if language is None or caption_language(caption.code) == language.lower()]
+    manual = [caption for caption in candidates if not caption.code.startswith("a.")]
+    if manual:
+        return manual[0]
+    auto = [caption for caption in candidates if caption.code.startswith("a.")]
+    if allow_auto and auto:
+        return auto[0]
+    return None
+
+def fetch_youtube_captions(youtube_url, language=None, allow_auto=False, min_coverage=0.5):
+    """
+    Fetches the captions of a video if a track passes the quality policy (see
+    select_caption_track) and covers at least min_coverage of the video.
+
+    Returns:
+        dict or None: {"code", "auto", "segments"}, segments being {"start", "end", "text"} dicts
+    """
+    yt = _youtube(youtube_url)
+    with span("captions", source="youtube") as s:
+        caption = select_caption_track(list(yt.captions), language, allow_auto)
+        if caption is None:
+            logging.log(logging.INFO, f"No caption track of {youtube_url} passes the policy")
+            return None
+        srt = caption.generate_srt_captions()
+        s.set(bytes=len(srt.encode()))
+    segments = [segment for segment in parse_srt(srt) if segment["text"]]
+    covered = segments[-1]["end"] - segments[0]["start"] if segments else 0
+    if yt.length and covered < min_coverage * yt.length:
+        logging.log(logging.INFO, f"Captions {caption.code} of {youtube_url} cover only {covered:.0f}s of {yt.length}s")
+        return None
+    logging.log(logging.INFO, f"Using captions {caption.code} of {youtube_url}")
+    return {"code": caption.code, "auto": caption.code.startswith("a."), "segments": segments}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the process-wide requests.Session, whose connection pool is
+    shared by all downloads.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def download_file(url, filepath, progress_callback=None, min_chunk_size=64 * 1024, max_chunk_size=4 * 1024 * 1024, progress_interval=0.5):
+    """
+    Downloads a file through the shared session, resuming interrupted downloads.
+
+    Data is written to `filepath + ".part"` and moved to filepath once complete.
+    If a .part file is already there, only the missing bytes are requested with
+    an HTTP Range header. The read size grows while the connection keeps up and
+    shrinks when it slows down.
+
+    Args:
+        url (str): URL of the file
+        filepath (str): Destination path
+        progress_callback (callable): Called with (downloaded_size, total_size)
+            at most every progress_interval seconds, and once at the end
+
+    Returns:
+        int: size of the downloaded file
+    """
+    if os.path.exists(filepath):
+        size = os.path.getsize(filepath)
+        logging.log(logging.INFO, f"{filepath} already downloaded")
+        if progress_callback:
+            progress_callback(size, size)
+        return size
+
+    part_path = filepath + ".part"
+    resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+
+    with span("download", source="http") as s:
+        with get_session().get(url, stream=True, headers=headers, timeout=30) as r:
+            if r.status_code == 416:
+                # Nothing left to download, the .part file is complete
+                os.replace(part_path, filepath)
+                return resume_from
+            r.raise_for_status()
+            if r.status_code != 206:
+                # The server ignored the Range header, start over
+                resume_from = 0
+            total_size = int(r.headers.get('content-length', 0))
+            if total_size:
+                total_size += resume_from
+
+            downloaded_size = resume_from
+            chunk_size = min_chunk_size
+            last_progress = 0
+            with open(part_path, 'ab' if resume_from else 'wb') as f:
+                while True:
+                    read_start = time.monotonic()
+                    with raw_read_errors():
+                        chunk = r.raw.read(chunk_size, decode_content=True)
+                    if not chunk:
+                        break
+                    elapsed = time.monotonic() - read_start
+                    f.write(chunk)
+                    downloaded_size += len(chunk)
+
+                    if elapsed < 0.1:
+                        chunk_size = min(chunk_size * 2, max_chunk_size)
+                    elif elapsed > 1:
+                        chunk_size = max(chunk_size // 2, min_chunk_size)
+
+                    if progress_callback and time.monotonic() - last_progress >= progress_interval:
+                        last_progress = time.monotonic()
+                        progress_callback(downloaded_size, total_size)
+        s.set(bytes=downloaded_size - resume_from)
+
+    os.replace(part_path, filepath)
+    if progress_callback:
+        progress_callback(downloaded_size, total_size or downloaded_size)
+    logging.log(logging.INFO, f"Downloaded {url} to {filepath}")
+    return downloaded_size
+
+
+def follow_file(path, done, block_size=256 * 1024, poll_interval=0.2):
+    """
+    Yields the content of a file while another thread downloads it, until done is
+    set and everything was read. Downloads are written to path + ".part" first
+    (see download_file and download_audio_from_youtube), that file is followed
+    when it exists: the open file stays readable once it is renamed to path.
+
+    Args:
+        path (str): Destination path of the download
+        done (threading.Event): Set once the download finished or failed
+
+    Yields:
+        bytes: the next block of the file
+    """
+    f = None
+    while f is None:
+        for candidate in [path + ".part", path]:
+            try:
+                f = open(candidate, "rb")
+                break
+            except FileNotFoundError:
+                continue
+        if f is None:
+            if done.is_set():
+                # The download failed before writing anything
+                return
+            time.sleep(poll_interval)
+
+    with f:
+        while True:
+            # Checked before reading, so that the data written before done was set is not missed
+            finished = done.is_set()
+            data = f.read(block_size)
+            if data:
+                yield data
+            elif finished:
+                return
+            else:
+                time.sleep(poll_interval)
+
+
+def get_episode_file_name(title, url):
+    """
+    File name of a podcast episode: the safe title with the extension of the URL.
+    """
+    # safe_title = re.sub(r'[^\w\-_.]', '_', title)
+    safe_title = get_safe_file_name(title)
+    
+    # Extract filename from URL or use the safe title
+    url_path = urlparse(url).path
+    file_extension = os.path.splitext(url_path)[1] if url_path else ".mp3"
+    if not file_extension:
+        file_extension = ".mp3"  # Default extension for audio/mpeg
+    
+    return f"{safe_title}{file_extension}"
+
+
+def download_podcast_from_podcastindex_url(feed_url, media_type="audio/mpeg", download_dir=None, selected_indices=None, max_workers=None):
     """
     Downloads podcast audio files of a specified media type from an RSS feed URL.
     
@@ -56,49 +293,45 @@ def download_podcast_from_podcastindex_url(feed_url, media_type="audio/mpeg", do
         media_type (str): The media type to download (e.g., "audio/mpeg")
         download_dir (str): Directory to save downloaded files
         selected_indices (list): List of episode indices to download (None means user will be prompted)
+        max_workers (int): Maximum number of parallel downloads (default PODCAST_DOWNLOAD_WORKERS or 4)
         
     Returns:
         tuple: (list of episode info, downloaded files info)
     """
+    # Only this function reports to the page, the CLI and the workers do not import streamlit
+    import streamlit as st
+
+    if max_workers is None:
+        max_workers = int(os.getenv("PODCAST_DOWNLOAD_WORKERS", 4))
+
     # Create download directory if specified and it doesn't exist
     if download_dir and not os.path.exists(download_dir):
         os.makedirs(download_dir)
     
-    # Fetch the RSS feed
+    # Fetch the RSS feed, reruns are served from the feed cache
     try:
-        response = requests.get(feed_url)
-        response.raise_for_status()  # Raise exception for bad status codes
+        feed = get_feed_cache().get(feed_url, session=get_session())
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching RSS feed: {e}")
         return [], []
-    
-    # Parse XML content
-    try:
-        root = ET.fromstring(response.content)
     except ET.ParseError as e:
         st.error(f"Error parsing XML: {e}")
         return [], []
     
-    # Find channel element (typical RSS feed structure)
-    channel = root.find("channel") if root.tag == "rss" else root
-    
     # Get podcast title for display
-    podcast_title_elem = channel.find("title")
-    podcast_title = podcast_title_elem.text if podcast_title_elem is not None else "Podcast"
+    podcast_title = feed["title"]
     
     # Build list of episodes
     episodes = []
-    for i, item in enumerate(channel.findall("item")):
-        title_elem = item.find("title")
-        title = title_elem.text if title_elem is not None else f"Episode {i+1}"
+    for i, item in enumerate(feed["items"]):
+        title = item["title"] if item["title"] is not None else f"Episode {i+1}"
         
-        # Find the enclosure with the specified media type
-        enclosure = item.find("enclosure")
-        if enclosure is not None and (media_type is None or enclosure.get("type") == media_type):
+        # Keep the enclosures with the specified media type
+        if item["url"] is not None and (media_type is None or item["type"] == media_type):
             episodes.append({
                 "index": i,
                 "title": title,
-                "url": enclosure.get("url")
+                "url": item["url"]
             })
     
     # Reverse the episode numbering
@@ -117,19 +350,10 @@ def download_podcast_from_podcastindex_url(feed_url, media_type="audio/mpeg", do
     # Process selected episodes
     selected_episodes = [ep for ep in episodes if ep["index"] in selected_indices]
     
-    # Download selected episodes
-    downloaded = []
+    # Download selected episodes concurrently, the UI is only updated from this thread
+    jobs = []
     for episode in selected_episodes:
-        # safe_title = re.sub(r'[^\w\-_.]', '_', episode['title'])
-        safe_title = get_safe_file_name(episode['title'])
-        
-        # Extract filename from URL or use the safe title
-        url_path = urlparse(episode['url']).path
-        file_extension = os.path.splitext(url_path)[1] if url_path else ".mp3"
-        if not file_extension:
-            file_extension = ".mp3"  # Default extension for audio/mpeg
-            
-        filename = f"{safe_title}{file_extension}"
+        filename = get_episode_file_name(episode['title'], episode['url'])
         
         # Use either specified download directory or temporary directory
         if download_dir:
@@ -137,34 +361,48 @@ def download_podcast_from_podcastindex_url(feed_url, media_type="audio/mpeg", do
         else:
             temp_dir = tempfile.mkdtemp()
             filepath = os.path.join(temp_dir, filename)
-        
-        with st.status(f"Downloading: {episode['title']}", expanded=True) as status:
-            try:
-                # Stream download to handle large files
-                with requests.get(episode['url'], stream=True) as r:
-                    r.raise_for_status()
-                    total_size = int(r.headers.get('content-length', 0))
-                    
-                    with open(filepath, 'wb') as f:
-                        downloaded_size = 0
-                        chunk_size = 8192
-                        for chunk in r.iter_content(chunk_size=chunk_size):
-                            if chunk:
-                                f.write(chunk)
-                                downloaded_size += len(chunk)
-                                
-                                # Update progress
-                                if total_size > 0:
-                                    percent = (downloaded_size / total_size) * 100
-                                    status.update(label=f"Downloading: {episode['title']} - {percent:.1f}%")
-                    
-                    status.update(label=f"Downloaded: {episode['title']}", state="complete")
-                    downloaded.append({
-                        "title": episode['title'],
-                        "path": filepath,
-                        "size": total_size
-                    })
-            except requests.exceptions.RequestException as e:
-                status.update(label=f"Error downloading {episode['title']}: {e}", state="error")
+
+        jobs.append((episode, filepath, st.status(f"Downloading: {episode['title']}", expanded=True)))
+
+    progress = {}
+
+    def _download(episode, filepath):
+        def _on_progress(downloaded_size, total_size):
+            progress[filepath] = (downloaded_size, total_size)
+        return download_file(episode['url'], filepath, progress_callback=_on_progress)
+
+    downloaded = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_download, episode, filepath): (episode, filepath, status) for episode, filepath, status in jobs}
+        pending = set(futures)
+        shown = {}
+        while pending:
+            done, pending = wait(pending, timeout=0.5)
+            # Update progress at most twice per second per episode
+            for future, (episode, filepath, status) in futures.items():
+                if future in pending and filepath in progress and shown.get(filepath) != progress[filepath]:
+                    shown[filepath] = progress[filepath]
+                    downloaded_size, total_size = progress[filepath]
+                    if total_size > 0:
+                        percent = (downloaded_size / total_size) * 100
+                        status.update(label=f"Downloading: {episode['title']} - {percent:.1f}%")
+            for future in done:
+                episode, filepath, status = futures[future]
+                try:
+                    total_size = future.result()
+                except (requests.exceptions.RequestException, OSError) as e:
+                    # Only this episode failed, its .part file is resumed next time
+                    status.update(label=f"Error downloading {episode['title']}: {e}", state="error")
+                    continue
+                status.update(label=f"Downloaded: {episode['title']}", state="complete")
+                downloaded.append({
+                    "title": episode['title'],
+                    "path": filepath,
+                    "size": total_size
+                })
+
+    # Keep the order of the selection
+    order = {filepath: i for i, (_, filepath, _) in enumerate(jobs)}
+    downloaded.sort(key=lambda file_info: order[file_info["path"]])
     
     return episodes, downloaded
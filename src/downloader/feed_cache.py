@@ -0,0 +1,148 @@
+import contextlib
+import logging
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import requests
+import urllib3
+
+
+@contextlib.contextmanager
+def raw_read_errors():
+    """
+    Reads of response.raw raise urllib3 errors (e.g. when the connection drops
+    mid-body), they are raised as the requests exceptions Response.iter_content uses.
+    """
+    try:
+        yield
+    except urllib3.exceptions.ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e) from e
+    except urllib3.exceptions.DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e) from e
+    except urllib3.exceptions.ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e) from e
+    except urllib3.exceptions.SSLError as e:
+        raise requests.exceptions.SSLError(e) from e
+    except urllib3.exceptions.HTTPError as e:
+        raise requests.exceptions.RequestException(e) from e
+
+
+def parse_feed(stream):
+    """
+    Parses an RSS feed incrementally with iterparse, dropping every <item>
+    once it has been read, so memory does not grow with the number of episodes.
+
+    Args:
+        stream: binary file-like object with the feed XML
+
+    Returns:
+        dict: {"title": podcast title, "items": list of item dicts with
+        title, enclosure url and enclosure type (None when missing)}
+    """
+    title = None
+    items = []
+    stack = []
+    in_item = False
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == "item":
+                in_item = True
+            continue
+
+        stack.pop()
+        if elem.tag == "title" and not in_item and title is None:
+            title = elem.text
+        elif elem.tag == "item":
+            in_item = False
+            title_elem = elem.find("title")
+            enclosure = elem.find("enclosure")
+            items.append({
+                "title": title_elem.text if title_elem is not None else None,
+                "url": enclosure.get("url") if enclosure is not None else None,
+                "type": enclosure.get("type") if enclosure is not None else None,
+            })
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+    return {"title": title or "Podcast", "items": items}
+
+
+class FeedCache:
+    """
+    In-memory cache of parsed feeds, keyed by feed URL.
+
+    Entries younger than ttl seconds are returned without touching the network.
+    Older ones are revalidated with a conditional GET (ETag / Last-Modified),
+    and the feed is only downloaded and parsed again if it changed.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def get(self, feed_url, session=None, force_refresh=False):
+        """
+        Returns the parsed feed (see parse_feed).
+
+        Raises:
+            requests.exceptions.RequestException: if the feed cannot be fetched
+            xml.etree.ElementTree.ParseError: if the feed is not valid XML
+        """
+        with self._lock:
+            entry = self._feeds.get(feed_url)
+        if entry is not None and not force_refresh and time.monotonic() - entry["fetched_at"] < self.ttl:
+            return entry["feed"]
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        session = session or requests
+        with session.get(feed_url, headers=headers, stream=True, timeout=30) as response:
+            if response.status_code == 304 and entry is not None:
+                logging.log(logging.INFO, f"Feed not modified: {feed_url}")
+                feed = entry["feed"]
+            else:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                # A connection dropped mid-feed is a RequestException for the callers
+                with raw_read_errors():
+                    feed = parse_feed(response.raw)
+                logging.log(logging.INFO, f"Parsed {len(feed['items'])} items from {feed_url}")
+
+            with self._lock:
+                self._feeds[feed_url] = {
+                    "feed": feed,
+                    # A 304 does not have to repeat the validators
+                    "etag": response.headers.get("ETag") or (entry["etag"] if entry else None),
+                    "last_modified": response.headers.get("Last-Modified") or (entry["last_modified"] if entry else None),
+                    "fetched_at": time.monotonic(),
+                }
+        return feed
+
+    def invalidate(self, feed_url=None):
+        with self._lock:
+            if feed_url is None:
+                self._feeds.clear()
+            else:
+                self._feeds.pop(feed_url, None)
+
+
+_feed_cache = None
+_feed_cache_lock = threading.Lock()
+
+
+def get_feed_cache():
+    """Returns the process-wide feed cache."""
+    global _feed_cache
+    with _feed_cache_lock:
+        if _feed_cache is None:
+            _feed_cache = FeedCache()
+        return _feed_cache
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+TRANSCRIBING = "transcribing"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = [DOWNLOADING, TRANSCRIBING]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    title TEXT,
+    backend TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    audio_path TEXT,
+    result TEXT,
+    error TEXT,
+    trace TEXT,
+    stats TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class JobStore:
+    """
+    Persistent job queue in SQLite.
+
+    A job is one source (YouTube URL, podcast episode URL or local file) going
+    through the download -> transcribe stages. Its status is one of QUEUED,
+    DOWNLOADING, TRANSCRIBING, DONE or FAILED; params, result, stats (see
+    transcribe_audio) and the trace of its stages (see src.utils.metrics) are
+    stored as JSON.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Claims must be atomic between the worker threads of this process
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            # Databases created before traces and stats were stored
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            for name in ["trace", "stats"]:
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} TEXT")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["trace"] = json.loads(job["trace"]) if job.get("trace") is not None else None
+        job["stats"] = json.loads(job["stats"]) if job.get("stats") is not None else None
+        return job
+
+    def add_job(self, kind, source, backend, params, title=None):
+        """
+        Args:
+            kind (str): "youtube", "podcast" or "file"
+            source (str): URL or path to transcribe
+            backend (str): "api" or "local", used for the per-backend concurrency limits
+            params (dict): Arguments of transcribe_audio
+            title (str): Display name
+
+        Returns:
+            int: the job id
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, source, title, backend, params, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, source, title or source, backend, json.dumps(params), QUEUED, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim_next(self, backends):
+        """
+        Marks the oldest queued job of one of the given backends as DOWNLOADING and returns it.
+
+        Returns:
+            dict or None: the claimed job
+        """
+        if not backends:
+            return None
+        placeholders = ",".join("?" for _ in backends)
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = ? AND backend IN ({placeholders}) ORDER BY id LIMIT 1",
+                (QUEUED, *backends),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (DOWNLOADING, time.time(), row["id"]))
+        job = self._to_dict(row)
+        job["status"] = DOWNLOADING
+        return job
+
+    def update(self, job_id, **fields):
+        for name in ["result", "trace", "stats"]:
+            if name in fields:
+                fields[name] = json.dumps(fields[name], default=str)
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, limit=100):
+        """Most recent jobs first, without their results."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, source, title, backend, status, error, created_at, updated_at "
+                "FROM jobs ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def requeue_interrupted(self):
+        """Puts back in the queue the jobs that were running when the process stopped."""
+        placeholders = ",".join("?" for _ in ACTIVE_STATUSES)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = ?, updated_at = ? WHERE status IN ({placeholders})",
+                (QUEUED, time.time(), *ACTIVE_STATUSES),
+            )
+            return cursor.rowcount
@@ -0,0 +1,175 @@
+import functools
+import logging
+import os
+import threading
+
+from src.downloader.downloader import download_audio_from_youtube, download_file, get_episode_file_name
+from src.jobs.store import DONE, FAILED, TRANSCRIBING, JobStore
+from src.transcription.service import caption_result, index_transcript, method_backend, transcribe_audio
+from src.transcription.streaming import transcribe_while_downloading
+from src.utils.metrics import trace
+
+
+class JobManager:
+    """
+    Runs the queued jobs of a JobStore on a pool of worker threads.
+
+    Each job is downloaded (unless it is a local file) and then transcribed.
+    backend_limits caps how many jobs of each backend run at the same time,
+    e.g. a couple of jobs for the local model and a few for the Groq API, so a long
+    local inference does not hold back API jobs and vice versa.
+    """
+
+    def __init__(self, store, backend_limits=None, download_dir="downloads", poll_interval=1.0):
+        self.store = store
+        self.backend_limits = backend_limits or {"api": 4, "local": 2}
+        self.download_dir = download_dir
+        self.poll_interval = poll_interval
+        self._running = {backend: 0 for backend in self.backend_limits}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Requeues the jobs interrupted by a restart and starts the workers."""
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            logging.log(logging.INFO, f"Requeued {requeued} interrupted jobs")
+        for i in range(sum(self.backend_limits.values())):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, kind, source, transcription_method, model_name, language=None, return_text_only=True, options=None, title=None):
+        """
+        Queues a job, see transcribe_audio for the transcription arguments.
+        With options["streaming"], YouTube and podcast jobs are transcribed while
+        they are downloaded (see transcribe_while_downloading).
+
+        Args:
+            kind (str): "youtube" (source is a URL), "podcast" (source is the
+                episode URL) or "file" (source is a local path)
+            title (str): Display name, also used for the podcast file name
+
+        Returns:
+            int: the job id
+        """
+        params = {
+            "transcription_method": transcription_method,
+            "model_name": model_name,
+            "language": language,
+            "return_text_only": return_text_only,
+            "options": options or {},
+        }
+        job_id = self.store.add_job(kind, source, method_backend(transcription_method), params, title=title)
+        self._wakeup.set()
+        return job_id
+
+    def _claim(self):
+        with self._lock:
+            backends = [backend for backend, limit in self.backend_limits.items() if self._running[backend] < limit]
+            job = self.store.claim_next(backends)
+            if job is not None:
+                self._running[job["backend"]] += 1
+            return job
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running[job["backend"]] -= 1
+                # A slot was freed, another worker may now claim a job of this backend
+                self._wakeup.set()
+
+    def _run(self, job):
+        job_stats = {}
+        with trace(f"job-{job['id']}") as job_trace:
+            try:
+                result = None
+                if job["kind"] == "youtube":
+                    # Captions that pass the policy replace both the download and the transcription
+                    params = job["params"]
+                    result = caption_result(job["source"], params["transcription_method"], params["language"], params["return_text_only"], params["options"], job_stats)
+                if result is None and job["params"]["options"].get("streaming") and job["kind"] != "file":
+                    result = self._stream(job, job_stats)
+                if result is None:
+                    audio_path = self._download(job)
+                    self.store.update(job["id"], status=TRANSCRIBING, audio_path=audio_path)
+                    result = transcribe_audio(audio_path, stats=job_stats, **job["params"])
+                index_transcript(result, job["source"], job["title"], job["kind"], job["params"]["transcription_method"], job["params"]["model_name"])
+                self.store.update(job["id"], status=DONE, result=result, stats=job_stats, trace=job_trace.to_dict())
+                logging.log(logging.INFO, f"Job {job['id']} done")
+            except Exception as e:
+                logging.log(logging.ERROR, f"Job {job['id']} failed: {e}")
+                self.store.update(job["id"], status=FAILED, error=str(e), stats=job_stats, trace=job_trace.to_dict())
+
+    def _stream(self, job, stats):
+        # Transcribed while it is downloaded, the file is kept like a regular download
+        audio_path = job["audio_path"]
+        if audio_path is None:
+            # Named before the download starts, YouTube titles are only known once it has
+            name = f"youtube-{job['id']}.mp3" if job["kind"] == "youtube" else get_episode_file_name(job["title"], job["source"])
+            audio_path = os.path.join(self.download_dir, name)
+        os.makedirs(self.download_dir, exist_ok=True)
+        if job["kind"] == "youtube":
+            download = functools.partial(download_audio_from_youtube, job["source"], file_path=audio_path)
+        else:
+            download = functools.partial(download_file, job["source"], audio_path)
+        self.store.update(job["id"], status=TRANSCRIBING, audio_path=audio_path)
+        return transcribe_while_downloading(download, audio_path, stats=stats, **job["params"])
+
+    def _download(self, job):
+        # A job interrupted while transcribing does not need to be downloaded again
+        if job["audio_path"] and os.path.exists(job["audio_path"]):
+            return job["audio_path"]
+        if job["kind"] == "file":
+            return job["source"]
+
+        os.makedirs(self.download_dir, exist_ok=True)
+        if job["kind"] == "youtube":
+            return download_audio_from_youtube(job["source"], download_dir=self.download_dir)
+        if job["kind"] == "podcast":
+            filepath = os.path.join(self.download_dir, get_episode_file_name(job["title"], job["source"]))
+            download_file(job["source"], filepath)
+            return filepath
+        raise ValueError(f"Invalid job kind: {job['kind']}")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """
+    Returns the process-wide job manager, started on first use and configured from
+    JOBS_DB_PATH (default ./data/jobs.db), JOBS_API_CONCURRENCY (default 4) and
+    JOBS_LOCAL_CONCURRENCY (default 2).
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(
+                JobStore(os.getenv("JOBS_DB_PATH", "./data/jobs.db")),
+                backend_limits={
+                    "api": int(os.getenv("JOBS_API_CONCURRENCY", 4)),
+                    # Local jobs share the model's batch scheduler
+                    "local": int(os.getenv("JOBS_LOCAL_CONCURRENCY", 2)),
+                },
+            )
+            _manager.start()
+        return _manager
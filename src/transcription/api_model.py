@@ -1,49 +1,245 @@
 import os
 import json
-from groq import Groq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.transcription.groq_client import call_with_retries, get_client, get_rate_limiter
+from src.utils.audio import SAMPLING_RATE, encode_samples, encode_segment, find_split_points, frame_energies, iter_chunks, probe_duration
+from src.utils.cache import get_cache
+from src.utils.metrics import run_in_context, span
+
+# Upper bound of the size of 16 kHz mono 16-bit audio, FLAC is always smaller
+BYTES_PER_SECOND = 16000 * 2
 
 
 class ApiModel():
   def __init__(
-    self, 
-    model_name="whisper-large-v3", 
-    prompt=None, 
-    response_format="verbose_json", 
-    timestamp_granularities=["segment"], 
-    language=None, 
-    temperature=None, 
-    return_text_only=False
+    self,
+    model_name="whisper-large-v3",
+    prompt=None,
+    response_format="verbose_json",
+    timestamp_granularities=None,
+    language=None,
+    temperature=None,
+    return_text_only=False,
+    client=None,
+    use_cache=True
     ):
     self.model_name=model_name
     self.response_format = response_format
-    self.timestamp_granularities = timestamp_granularities
+    # ["word", "segment"] for word timestamps, needs response_format="verbose_json"
+    self.timestamp_granularities = timestamp_granularities or ["segment"]
     self.language = language
     self.temperature = temperature
     self.return_text_only = return_text_only
+    # Shared, pooled client unless a specific one is given
+    self.client = client
+    self.use_cache = use_cache
 
     if prompt is None:
       self.prompt = "You are translating audio files in a precise and contextual way."
+    else:
+      self.prompt = prompt
+
+  def cache_params(self):
+    """Parameters that change the transcription, part of the cache key."""
+    return {
+      "backend": "groq",
+      "model_name": self.model_name,
+      "language": self.language,
+      "prompt": self.prompt,
+      "response_format": self.response_format,
+      "temperature": self.temperature,
+      "timestamp_granularities": self.timestamp_granularities,
+    }
+
+  def _cached(self, filename, transcribe_fn, return_text_only):
+    # Results are cached as verbose_json dicts and formatted on the way out
+    cache = get_cache() if self.use_cache else None
+    key = cache.make_key(filename, self.cache_params()) if cache else None
+    result = cache.get(key) if cache else None
+    if result is None:
+      result = transcribe_fn()
+      if cache:
+        cache.set(key, result)
+    return self._format(result, return_text_only)
+
+  def _format(self, result, return_text_only):
+    if return_text_only:
+      return result["text"]
+    else:
+      return json.dumps(result, indent=2, default=str)
+
+  def _create_transcription(self, filename, data, audio_seconds=0):
+    client = self.client or get_client()
+
+    def _request():
+      # Every attempt counts against the quota
+      with span("rate_limit_wait"):
+        get_rate_limiter().acquire(audio_seconds)
+      return client.audio.transcriptions.create(
+        file=(filename, data),
+        model=self.model_name,
+        prompt=self.prompt,
+        response_format=self.response_format,
+        timestamp_granularities = self.timestamp_granularities, #["word", "segment"], # Optional (must set response_format to "json" to use and can specify "word", "segment" (default), or both)
+        language=self.language,  # Optional
+        temperature=self.temperature  # Optional
+        )
+
+    with span("api_request", model=self.model_name, bytes=len(data), audio_seconds=audio_seconds):
+      return call_with_retries(_request)
 
-  
   def transcribe(self, filename, return_text_only=None):
-    client = Groq()
+    if return_text_only is None:
+      return_text_only = self.return_text_only
+
+    def _transcribe():
+      audio_seconds = probe_duration(filename) if get_rate_limiter().audio_seconds is not None else 0
+      with open(filename, "rb") as file:
+          transcription = self._create_transcription(filename, file.read(), audio_seconds)
+      return _to_dict(transcription)
+
+    return self._cached(filename, _transcribe, return_text_only)
 
+  def transcribe_chunked(self, filename, return_text_only=None, max_chunk_bytes=24 * 1024 * 1024, max_chunk_s=600, max_workers=4, on_partial=None):
+    """
+    Transcribes a long file by cutting it at silences into size-bounded
+    chunks that are uploaded concurrently, then stitching the results.
+
+    Args:
+      filename (str): Path of the audio file
+      return_text_only (bool): Return only the text instead of the JSON result
+      max_chunk_bytes (int): Maximum upload size of a chunk
+      max_chunk_s (float): Maximum chunk duration, smaller chunks mean more parallelism
+      max_workers (int): Maximum number of concurrent uploads
+      on_partial (callable): Called with the verbose_json result of every chunk,
+        in order and with timestamps relative to the file, as soon as it is available
+
+    Returns:
+      str: the text, or the stitched verbose_json result with timestamps
+      relative to the beginning of the file
+    """
     if return_text_only is None:
       return_text_only = self.return_text_only
-    
-    with open(filename, "rb") as file:
-        transcription = client.audio.transcriptions.create(
-          file=(filename, file.read()),
-          model=self.model_name,
-          prompt=self.prompt,
-          response_format=self.response_format,
-          timestamp_granularities = self.timestamp_granularities, #["word", "segment"], # Optional (must set response_format to "json" to use and can specify "word", "segment" (default), or both)
-          language=self.language,  # Optional
-          temperature=self.temperature  # Optional
-          )
-
-    if self.return_text_only:
-      return transcription.text
-    else:
-      return json.dumps(transcription, indent=2, default=str)
-      
\ No newline at end of file
+
+    def _transcribe():
+      chunks = find_split_points(frame_energies(filename), min(max_chunk_s, max_chunk_bytes / BYTES_PER_SECOND))
+      logging.log(logging.INFO, f"Split {filename} into {len(chunks)} chunks")
+      base_name = os.path.splitext(os.path.basename(filename))[0]
+
+      def _transcribe_chunk(i):
+        start, end = chunks[i]
+        with span("encode", audio_seconds=end - start) as s:
+          data = encode_segment(filename, start, end - start)
+          s.set(bytes=len(data))
+        return self._create_transcription(f"{base_name}_{i}.flac", data, end - start)
+
+      with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [run_in_context(executor, _transcribe_chunk, i) for i in range(len(chunks))]
+        transcriptions = []
+        for future, (start, _) in zip(futures, chunks):
+          transcriptions.append(future.result())
+          if on_partial is not None:
+            on_partial(stitch_transcriptions(transcriptions[-1:], [start]))
+
+      return stitch_transcriptions(transcriptions, [start for start, _ in chunks])
+
+    return self._cached(filename, _transcribe, return_text_only)
+
+  def transcribe_stream(self, filename, blocks, return_text_only=None, chunk_length_s=30, max_workers=4, on_partial=None):
+    """
+    Transcribes audio while it is still arriving, e.g. decoded while filename is
+    downloaded: the stream is cut at silences into chunks of at most chunk_length_s,
+    and each chunk is uploaded as soon as it is complete.
+
+    Args:
+      filename (str): Path of the audio file, the result is cached under it if it exists once the stream ends
+      blocks (iterable): Decoded samples, see decode_stream
+      return_text_only (bool): Return only the text instead of the JSON result
+      chunk_length_s (float): Maximum chunk duration, short chunks mean an early first result
+      max_workers (int): Maximum number of concurrent uploads
+      on_partial (callable): Called with the verbose_json result of every chunk, in order
+        and with timestamps relative to the file, as soon as it and the previous ones are done
+
+    Returns:
+      str: the text, or the stitched verbose_json result
+    """
+    if return_text_only is None:
+      return_text_only = self.return_text_only
+    base_name = os.path.splitext(os.path.basename(filename))[0]
+
+    def _transcribe_chunk(i, samples):
+      audio_seconds = len(samples) / SAMPLING_RATE
+      with span("encode", audio_seconds=audio_seconds) as s:
+        data = encode_samples(samples)
+        s.set(bytes=len(data))
+      return self._create_transcription(f"{base_name}_{i}.flac", data, audio_seconds)
+
+    futures, offsets, transcriptions = [], [], []
+    lock = threading.Lock()
+
+    def _emit_done(_=None):
+      # Chunks finish in any order, they are passed on in order
+      with lock:
+        while len(transcriptions) < len(futures):
+          future = futures[len(transcriptions)]
+          if not future.done() or future.exception() is not None:
+            return
+          transcriptions.append(future.result())
+          if on_partial is not None:
+            on_partial(stitch_transcriptions(transcriptions[-1:], offsets[len(transcriptions) - 1:len(transcriptions)]))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      for i, (start, samples) in enumerate(iter_chunks(blocks, chunk_length_s)):
+        with lock:
+          offsets.append(start)
+          futures.append(run_in_context(executor, _transcribe_chunk, i, samples))
+        futures[-1].add_done_callback(_emit_done)
+    # Raises the error of the first failed chunk
+    results = [future.result() for future in futures]
+    _emit_done()
+    result = stitch_transcriptions(results, offsets)
+
+    if self.use_cache and os.path.exists(filename):
+      cache = get_cache()
+      cache.set(cache.make_key(filename, self.cache_params()), result)
+    return self._format(result, return_text_only)
+
+
+def _to_dict(transcription):
+  if isinstance(transcription, str):
+    return {"text": transcription}
+  if hasattr(transcription, "model_dump"):
+    return transcription.model_dump()
+  return dict(transcription)
+
+
+def stitch_transcriptions(transcriptions, offsets):
+  """
+  Joins the transcriptions of consecutive chunks into one verbose_json-like
+  result, shifting segment and word timestamps by the chunk offsets.
+  """
+  result = {"text": "", "segments": [], "words": []}
+  texts = []
+  for transcription, offset in zip(transcriptions, offsets):
+    transcription = _to_dict(transcription)
+    texts.append((transcription.get("text") or "").strip())
+    for segment in transcription.get("segments") or []:
+      segment = dict(segment)
+      segment["id"] = len(result["segments"])
+      segment["start"] = round(segment["start"] + offset, 3)
+      segment["end"] = round(segment["end"] + offset, 3)
+      result["segments"].append(segment)
+    for word in transcription.get("words") or []:
+      word = dict(word)
+      word["start"] = round(word["start"] + offset, 3)
+      word["end"] = round(word["end"] + offset, 3)
+      result["words"].append(word)
+  result["text"] = " ".join(text for text in texts if text)
+  if result["segments"]:
+    result["duration"] = result["segments"][-1]["end"]
+  if not result["words"]:
+    del result["words"]
+  return result
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import time
+
+from src.utils.utils import get_safe_file_name, word_error_rate
+
+# eager: plain PyTorch, int8: dynamic quantization of the Linear layers (CPU only),
+# onnx: ONNX Runtime export through optimum (CPU), compile: torch.compile'd forward
+BACKENDS = ["eager", "int8", "onnx", "compile"]
+CPU_ONLY_BACKENDS = ["int8", "onnx"]
+
+ONNX_CACHE_DIR = os.getenv("WHISPER_ONNX_CACHE_DIR", "./onnx_models")
+
+# torch and transformers are imported on first use: they take seconds to import and
+# hundreds of MB of memory, which API-only deployments never need
+
+
+def load_seq2seq_model(model_name, backend="eager", torch_dtype=None, device="cpu"):
+    """
+    Loads a Whisper checkpoint for the given inference backend.
+
+    Args:
+        model_name (str): HuggingFace checkpoint name
+        backend (str): One of BACKENDS
+        torch_dtype (torch.dtype): Weights dtype, float32 if None (ignored by int8 and onnx, which run in float32)
+        device (str): Device to load on
+
+    Returns:
+        a model usable by the transformers ASR pipeline
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid backend. Possible values are {BACKENDS}, got {backend}")
+    if backend in CPU_ONLY_BACKENDS and device != "cpu":
+        raise ValueError(f"The {backend} backend only runs on cpu, got {device}")
+
+    if backend == "onnx":
+        return _load_onnx_model(model_name)
+
+    import torch
+    from transformers import AutoModelForSpeechSeq2Seq
+
+    model = AutoModelForSpeechSeq2Seq.from_pretrained(
+        model_name,
+        torch_dtype=torch.float32 if backend == "int8" or torch_dtype is None else torch_dtype,
+        low_cpu_mem_usage=True,
+        use_safetensors=True,
+    ).to(device)
+
+    if backend == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "compile":
+        model.forward = torch.compile(model.forward)
+
+    return model
+
+
+def _load_onnx_model(model_name):
+    try:
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+    except ImportError as e:
+        raise ImportError("The onnx backend requires optimum: pip install optimum[onnxruntime]") from e
+
+    # The export is slow, so it is done once and kept on disk
+    export_dir = os.path.join(ONNX_CACHE_DIR, get_safe_file_name(model_name))
+    if os.path.isdir(export_dir):
+        return ORTModelForSpeechSeq2Seq.from_pretrained(export_dir)
+    model = ORTModelForSpeechSeq2Seq.from_pretrained(model_name, export=True)
+    model.save_pretrained(export_dir)
+    return model
+
+
+def compare_backends(model_name, fixture_path, backends=BACKENDS, reference_text=None):
+    """
+    Transcribes a fixture clip with every backend and compares speed and accuracy
+    against the float32 eager baseline.
+
+    Args:
+        model_name (str): HuggingFace checkpoint name
+        fixture_path (str): Audio clip used for the comparison
+        backends (list): Backends to evaluate
+        reference_text (str): Ground truth transcript. If None, the baseline output is used,
+            so wer_delta is the WER of each backend against the baseline
+
+    Returns:
+        list: one dict per backend with seconds, wer and wer_delta, fastest first.
+        If the baseline fails, wer_delta is None for every backend (and wer too
+        without a reference_text), there is nothing to compare against
+    """
+    # Imported here to avoid a circular import, local_model uses this module
+    from src.transcription.local_model import Model
+
+    results = []
+    baseline_wer = None
+    baseline_failed = False
+    for backend in ["eager"] + [b for b in backends if b != "eager"]:
+        # Cached results would make every call after the first a file read
+        model = Model(model_name, device="cpu", backend=backend, use_cache=False)
+        try:
+            model.load_model()
+            # The first call pays for compilation/graph setup, it is not representative
+            model.transcribe([fixture_path])
+            start = time.monotonic()
+            text = model.transcribe([fixture_path])[0]["text"]
+            seconds = time.monotonic() - start
+        except Exception as e:
+            results.append({"backend": backend, "error": str(e)})
+            baseline_failed = baseline_failed or backend == "eager"
+            continue
+        finally:
+            model.unload_model()
+
+        if baseline_failed:
+            # Another backend must not become its own reference
+            wer = word_error_rate(reference_text, text) if reference_text is not None else None
+            results.append({"backend": backend, "seconds": round(seconds, 3), "wer": wer, "wer_delta": None})
+            continue
+        if reference_text is None:
+            reference_text = text
+        wer = word_error_rate(reference_text, text)
+        if baseline_wer is None:
+            baseline_wer = wer
+        if backend in backends:
+            results.append({"backend": backend, "seconds": round(seconds, 3), "wer": wer, "wer_delta": wer - baseline_wer})
+
+    return sorted(results, key=lambda r: r.get("seconds", float("inf")))
+
+
+def pick_backend(results, max_wer_delta=0.02):
+    """
+    Returns the fastest backend of compare_backends whose WER delta is within max_wer_delta.
+    Backends without a WER delta (failed, or the baseline failed) are never picked.
+    """
+    for result in results:
+        if result.get("wer_delta") is not None and result["wer_delta"] <= max_wer_delta:
+            return result["backend"]
+    return "eager"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare local inference backends on a fixture clip")
+    parser.add_argument("fixture", help="Path of the audio clip")
+    parser.add_argument("--model", default="openai/whisper-tiny")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--reference", help="Path of a text file with the ground truth transcript")
+    parser.add_argument("--max-wer-delta", type=float, default=0.02)
+    args = parser.parse_args()
+
+    reference_text = None
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference_text = f.read()
+
+    results = compare_backends(args.model, args.fixture, args.backends, reference_text)
+    print(json.dumps(results, indent=2))
+    print(f"Fastest backend within {args.max_wer_delta} WER delta: {pick_backend(results, args.max_wer_delta)}")
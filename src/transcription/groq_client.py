@@ -0,0 +1,170 @@
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `capacity` tokens, refilled at `rate` tokens per second.
+    acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, amount=1):
+        # A single request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Caps requests per minute and audio seconds per hour to the account quota.
+    A limit of None means unlimited.
+    """
+
+    def __init__(self, requests_per_minute=None, audio_seconds_per_hour=None):
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute else None
+        self.audio_seconds = TokenBucket(audio_seconds_per_hour / 3600, audio_seconds_per_hour) if audio_seconds_per_hour else None
+
+    def acquire(self, audio_seconds=0):
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.audio_seconds is not None and audio_seconds:
+            self.audio_seconds.acquire(audio_seconds)
+
+
+def _retry_after(error):
+    """Seconds to wait according to the Retry-After headers of a failed response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def _is_retryable(error):
+    # Only called once a request failed, so groq is already imported
+    import groq
+
+    if isinstance(error, groq.APIConnectionError):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def call_with_retries(fn, max_retries=5, base_delay=1.0, max_delay=60.0):
+    """
+    Calls fn(), retrying rate-limit (429), server (5xx) and connection errors
+    with jittered exponential backoff. A Retry-After header takes precedence
+    over the computed delay.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                # Full jitter: spread the retries of concurrent workers
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logging.log(logging.WARNING, f"Groq request failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+_client = None
+_limiter = None
+_client_lock = threading.Lock()
+
+
+def get_client(base_url=None):
+    """
+    Returns the process-wide Groq client. Its connection pool is shared by all
+    ApiModel instances, so TLS connections are reused between calls.
+    The SDK retries are disabled, retries are handled by call_with_retries.
+
+    Args:
+        base_url (str): API base URL, defaults to GROQ_BASE_URL (e.g. a local stub server)
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Imported on first use, sessions that only run the local model never pay for it
+            import groq
+            import httpx
+
+            max_connections = int(os.getenv("GROQ_MAX_CONNECTIONS", 8))
+            _client = groq.Groq(
+                base_url=base_url or os.getenv("GROQ_BASE_URL"),
+                max_retries=0,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                    timeout=httpx.Timeout(float(os.getenv("GROQ_TIMEOUT_S", 600)), connect=10.0),
+                ),
+            )
+        return _client
+
+
+def get_rate_limiter():
+    """
+    Returns the process-wide rate limiter, configured from
+    GROQ_REQUESTS_PER_MINUTE and GROQ_AUDIO_SECONDS_PER_HOUR (unset means unlimited).
+    """
+    global _limiter
+    with _client_lock:
+        if _limiter is None:
+            requests_per_minute = os.getenv("GROQ_REQUESTS_PER_MINUTE")
+            audio_seconds_per_hour = os.getenv("GROQ_AUDIO_SECONDS_PER_HOUR")
+            _limiter = RateLimiter(
+                requests_per_minute=float(requests_per_minute) if requests_per_minute else None,
+                audio_seconds_per_hour=float(audio_seconds_per_hour) if audio_seconds_per_hour else None,
+            )
+        return _limiter
+
+
+def reset_client():
+    """Closes the shared client and forgets the limiter, e.g. to point to another server."""
+    global _client, _limiter
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _limiter = None
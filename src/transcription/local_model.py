@@ -1,46 +1,219 @@
-import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
-import time
+import gc
+import itertools
+import logging
+
+from src.transcription.backends import BACKENDS, CPU_ONLY_BACKENDS, load_seq2seq_model
+from src.utils.audio import SAMPLING_RATE, iter_windows, stream_audio
+from src.utils.cache import get_cache
+from src.utils.metrics import span
+
+
+def merge_window_chunks(window, chunks, stride_length_s):
+    """
+    Shifts the timestamped chunks of one window to the file timeline and keeps
+    only the ones that window owns: consecutive windows overlap by
+    stride_length_s, and each side of the overlap is assigned to one of them.
+    """
+    window_end = window.start + len(window.audio) / SAMPLING_RATE
+    lower = -float("inf") if window.is_first else window.start + stride_length_s / 2
+    upper = float("inf") if window.is_last else window_end - stride_length_s / 2
+
+    merged = []
+    for chunk in chunks:
+        start, end = chunk["timestamp"]
+        start = window.start + (start or 0.0)
+        end = window.start + end if end is not None else window_end
+        if lower <= start < upper:
+            merged.append({"timestamp": (round(start, 2), round(end, 2)), "text": chunk["text"]})
+    return merged
+
+
+def chunks_to_result(text, chunks, word_timestamps=False):
+    """
+    Builds the result of a file from its timestamped chunks: {"text", "chunks"},
+    or {"text", "words"} like the API verbose_json when the chunks are words.
+    """
+    if not word_timestamps:
+        return {"text": text, "chunks": chunks}
+    return {
+        "text": text,
+        "words": [{"word": chunk["text"].strip(), "start": chunk["timestamp"][0], "end": chunk["timestamp"][1]} for chunk in chunks],
+    }
 
 
 class Model:
-    def __init__(self, model_name):
+    """
+    A local Whisper checkpoint. torch is only imported when a Model is created and
+    transformers when it is loaded, so importing this module stays cheap.
+    """
+
+    def __init__(self, model_name, torch_dtype=None, device=None, backend="eager", use_cache=True):
+        assert backend in BACKENDS, f"Invalid backend. Possible values are {BACKENDS}, got {backend}"
+        import torch
+
         self.model_name = model_name
-        device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        print(f'Using device: {device}')
-        torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-    
+        self.backend = backend
+        if backend in CPU_ONLY_BACKENDS:
+            device = "cpu"
+            torch_dtype = torch.float32
+        self.device = device or ("cuda:0" if torch.cuda.is_available() else "cpu")
+        print(f'Using device: {self.device} ({self.backend} backend)')
+        if torch_dtype is None:
+            torch_dtype = torch.float16 if self.device.startswith("cuda") else torch.float32
+        self.torch_dtype = torch_dtype
+        self.use_cache = use_cache
+        self.language = "it"
+        self.pipeline = None
+
+    @property
+    def key(self):
+        """Identifies a loaded checkpoint: (model_name, dtype, device, backend)."""
+        return (self.model_name, str(self.torch_dtype), self.device, self.backend)
+
     def load_model(self):
-        self.processor = AutoProcessor.from_pretrained(self.model_name)
-        self.model = AutoModelForSpeechSeq2Seq.from_pretrained(
-            self.model_name,
-            torch_dtype=torch_dtype,
-            low_cpu_mem_usage=True,
-            use_safetensors=True,
-        ).to(device)
-
-        self.model.generation_config.language = "<|it|>"
-
-        # Create a pipeline for preprocessing and transcribing speech data
-        self.pipeline = pipeline(
-            "automatic-speech-recognition",
-            model=self.model,
-            tokenizer=self.processor.tokenizer,
-            feature_extractor=self.processor.feature_extractor,
-            torch_dtype=torch_dtype,
-            device=device,
-        )
+        from transformers import AutoProcessor, pipeline
+
+        with span("model_load", model=self.model_name, backend=self.backend):
+            self.processor = AutoProcessor.from_pretrained(self.model_name)
+            self.model = load_seq2seq_model(
+                self.model_name,
+                backend=self.backend,
+                torch_dtype=self.torch_dtype,
+                device=self.device,
+            )
+
+            self.model.generation_config.language = f"<|{self.language}|>"
+
+            # Create a pipeline for preprocessing and transcribing speech data
+            self.pipeline = pipeline(
+                "automatic-speech-recognition",
+                model=self.model,
+                tokenizer=self.processor.tokenizer,
+                feature_extractor=self.processor.feature_extractor,
+                torch_dtype=self.torch_dtype,
+                device=self.device,
+            )
 
         print(f"Loaded model: {self.model_name}")
 
-    def transcribe(self, audio_samples):
+    def unload_model(self):
+        """Drops the references to the weights so the memory can be reclaimed."""
+        self.pipeline = None
+        self.model = None
+        self.processor = None
+        gc.collect()
+        if self.device.startswith("cuda"):
+            import torch
 
-        start = time.monotonic_ns()
-        print(f"Transcribing {len(audio_samples)} audio samples")
-        transcriptions = self.pipeline(audio_samples, batch_size=len(audio_samples), return_timestamps=True)
-        end = time.monotonic_ns()
-        print(
-            f"Transcribed {len(audio_samples)} samples in {round((end - start) / 1e9, 2)}s"
-        )
+            torch.cuda.empty_cache()
+        print(f"Unloaded model: {self.model_name}")
+
+    def memory_footprint(self):
+        """Size in bytes of the loaded weights (0 if the model is not loaded)."""
+        if self.pipeline is None:
+            return 0
+        if hasattr(self.model, "get_memory_footprint"):
+            return self.model.get_memory_footprint()
+        # ONNX Runtime sessions do not report their size
+        return 0
+
+    def cache_params(self, word_timestamps=False):
+        """Parameters that change the transcription, part of the cache key."""
+        params = {
+            "model_name": self.model_name,
+            "language": self.language,
+            "torch_dtype": str(self.torch_dtype),
+            "backend": self.backend,
+        }
+        if word_timestamps:
+            params["timestamps"] = "word"
+        return params
+
+    def cached_result(self, audio_path, word_timestamps=False):
+        """Returns the cached transcription of a file, or None. Does not need the model to be loaded."""
+        if not self.use_cache or not isinstance(audio_path, str):
+            return None
+        cache = get_cache()
+        return cache.get(cache.make_key(audio_path, self.cache_params(word_timestamps)))
+
+    def store_result(self, audio_path, result, word_timestamps=False):
+        """Stores the transcription of a file in the cache."""
+        if self.use_cache and isinstance(audio_path, str):
+            cache = get_cache()
+            cache.set(cache.make_key(audio_path, self.cache_params(word_timestamps)), result)
+
+    def transcribe(self, audio_samples, word_timestamps=False):
+        # Only the files missing from the cache go through the pipeline
+        transcriptions = [self.cached_result(sample, word_timestamps) for sample in audio_samples]
+        missing = [i for i, transcription in enumerate(transcriptions) if transcription is None]
+        if not missing:
+            return transcriptions
+
+        logging.log(logging.INFO, f"Transcribing {len(missing)} audio samples")
+        with span("inference", model=self.model_name, samples=len(missing)):
+            outputs = self.pipeline(
+                [audio_samples[i] for i in missing],
+                batch_size=len(missing),
+                return_timestamps="word" if word_timestamps else True,
+            )
+        for i, output in zip(missing, outputs):
+            if word_timestamps:
+                output = chunks_to_result(output["text"], output["chunks"], word_timestamps)
+            transcriptions[i] = output
+            self.store_result(audio_samples[i], output, word_timestamps)
         return transcriptions
 
+    def transcribe_long_form(self, audio_paths, chunk_length_s=30, stride_length_s=5, batch_size=8, word_timestamps=False):
+        """
+        Transcribes files of any length with bounded memory.
+
+        Audio is decoded incrementally into overlapping windows, windows from all
+        files are batched together up to batch_size, and the timestamped chunks
+        are merged back into one transcript per file.
+
+        Args:
+            audio_paths (list): Paths of the audio files
+            chunk_length_s (float): Window duration
+            stride_length_s (float): Overlap between consecutive windows
+            batch_size (int): Maximum number of windows per forward pass
+            word_timestamps (bool): Timestamps of every word instead of every segment
+
+        Returns:
+            list: one {"text", "chunks"} dict per file, like the pipeline output,
+            or {"text", "words"} with word timestamps
+        """
+        results = [self.cached_result(path, word_timestamps) for path in audio_paths]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        logging.log(logging.INFO, f"Transcribing {len(missing)} audio files in {chunk_length_s}s windows")
+        chunks_per_file = {i: [] for i in missing}
+        windows = (
+            (i, window)
+            for i in missing
+            for window in iter_windows(stream_audio(audio_paths[i]), chunk_length_s, stride_length_s)
+        )
+        n_windows = 0
+        audio_seconds = 0.0
+        # Decoding runs lazily inside this span, between the batches
+        with span("inference", model=self.model_name, files=len(missing)) as s:
+            while True:
+                batch = list(itertools.islice(windows, batch_size))
+                if not batch:
+                    break
+                outputs = self.pipeline(
+                    [{"raw": window.audio, "sampling_rate": SAMPLING_RATE} for _, window in batch],
+                    batch_size=batch_size,
+                    return_timestamps="word" if word_timestamps else True,
+                )
+                for (i, window), output in zip(batch, outputs):
+                    chunks_per_file[i].extend(merge_window_chunks(window, output["chunks"], stride_length_s))
+                    if window.is_last:
+                        audio_seconds += window.start + len(window.audio) / SAMPLING_RATE
+                n_windows += len(batch)
+            s.set(windows=n_windows, audio_seconds=audio_seconds)
+        for i, chunks in chunks_per_file.items():
+            results[i] = chunks_to_result("".join(chunk["text"] for chunk in chunks).strip(), chunks, word_timestamps)
+            self.store_result(audio_paths[i], results[i], word_timestamps)
+        return results
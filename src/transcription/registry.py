@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from src.transcription.local_model import Model
+from src.transcription.scheduler import close_scheduler
+
+
+class ModelRegistry:
+    """
+    Process-wide store of loaded local Whisper models.
+
+    Models are keyed by (model_name, dtype, device, backend) and loaded at most once,
+    even when several Streamlit sessions ask for the same checkpoint at the
+    same time. When more than `max_models` checkpoints are loaded, or their
+    weights exceed `max_memory_bytes`, the least recently used one is evicted:
+    the registry drops its reference, and the weights are freed once the
+    sessions still using the model are done with it.
+    """
+
+    def __init__(self, max_models=2, max_memory_bytes=None):
+        self.max_models = max_models
+        self.max_memory_bytes = max_memory_bytes
+        self._models = OrderedDict()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, model_name, torch_dtype=None, device=None, backend="eager"):
+        """
+        Returns a loaded Model, loading it first if needed.
+
+        Args:
+            model_name (str): HuggingFace checkpoint name
+            torch_dtype (torch.dtype): Weights dtype (None picks the device default)
+            device (str): Device to load on (None picks cuda if available)
+            backend (str): Inference backend, see src.transcription.backends
+
+        Returns:
+            Model: the shared, loaded model
+        """
+        model = Model(model_name, torch_dtype=torch_dtype, device=device, backend=backend)
+        key = model.key
+
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one session loads a given checkpoint, the others wait for it
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+
+            model.load_model()
+
+            with self._lock:
+                self._models[key] = model
+                self._load_locks.pop(key, None)
+                self._evict()
+
+        return model
+
+    def _evict(self):
+        # Called with self._lock held. The most recent model is never evicted.
+        while len(self._models) > 1:
+            over_count = self.max_models is not None and len(self._models) > self.max_models
+            over_memory = (
+                self.max_memory_bytes is not None
+                and sum(m.memory_footprint() for m in self._models.values()) > self.max_memory_bytes
+            )
+            if not (over_count or over_memory):
+                break
+            key, _ = self._models.popitem(last=False)
+            logging.log(logging.INFO, f"Evicting model {key}")
+            self._release(key)
+
+    def _release(self, key):
+        # The model is not unloaded, sessions may still be using it: it is garbage
+        # collected with its scheduler once the last of them drops it
+        close_scheduler(key)
+
+    def loaded_models(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    def clear(self):
+        with self._lock:
+            while self._models:
+                key, _ = self._models.popitem()
+                self._release(key)
+
+    def warm_up(self, model_names, background=True):
+        """
+        Loads the given checkpoints ahead of the first transcription.
+
+        Args:
+            model_names (list): Checkpoint names to load
+            background (bool): Load in a daemon thread instead of blocking
+
+        Returns:
+            threading.Thread or None: the loading thread if background is True
+        """
+        def _load():
+            for name in model_names:
+                try:
+                    self.get_model(name)
+                except Exception as e:
+                    logging.log(logging.ERROR, f"Warm-up of {name} failed: {e}")
+
+        if not background:
+            _load()
+            return None
+        thread = threading.Thread(target=_load, name="whisper-warmup", daemon=True)
+        thread.start()
+        return thread
+
+
+_registry = None
+_registry_lock = threading.Lock()
+_warmed_up = False
+
+
+def get_registry():
+    """
+    Returns the process-wide registry, configured from the environment:
+    WHISPER_MAX_MODELS (default 2) and WHISPER_MAX_MODEL_MEMORY_GB (default unbounded).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            max_memory_gb = os.getenv("WHISPER_MAX_MODEL_MEMORY_GB")
+            _registry = ModelRegistry(
+                max_models=int(os.getenv("WHISPER_MAX_MODELS", 2)),
+                max_memory_bytes=int(float(max_memory_gb) * 1024**3) if max_memory_gb else None,
+            )
+        return _registry
+
+
+def warm_up_from_env():
+    """
+    Starts loading the checkpoints listed in WHISPER_WARMUP_MODELS
+    (comma separated) once per process.
+    """
+    global _warmed_up
+    with _registry_lock:
+        if _warmed_up:
+            return
+        _warmed_up = True
+    model_names = [name.strip() for name in os.getenv("WHISPER_WARMUP_MODELS", "").split(",") if name.strip()]
+    if model_names:
+        get_registry().warm_up(model_names)
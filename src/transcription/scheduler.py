@@ -0,0 +1,230 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from src.transcription.local_model import chunks_to_result, merge_window_chunks
+from src.utils.audio import SAMPLING_RATE, iter_windows, stream_audio
+from src.utils.metrics import current_trace, get_rss_sampler, record
+
+
+class _Request:
+    def __init__(self, audio_path, stride_length_s, word_timestamps=False, on_partial=None):
+        self.audio_path = audio_path
+        self.stride_length_s = stride_length_s
+        self.word_timestamps = word_timestamps
+        self.on_partial = on_partial
+        self.future = Future()
+        # Batches run on the inference thread, their spans go to the trace of the submitter
+        self.trace = current_trace()
+        self.chunks = {}
+        self.n_windows = None
+        self.n_done = 0
+        self.n_emitted = 0
+        self.lock = threading.Lock()
+
+    def add_result(self, index, chunks):
+        with self.lock:
+            self.chunks[index] = chunks
+            self.n_done += 1
+            self._emit_partials()
+            return self._maybe_finish()
+
+    def _emit_partials(self):
+        # Windows are passed on in order, as soon as all the previous ones are done
+        while self.on_partial is not None and self.n_emitted in self.chunks:
+            chunks = self.chunks[self.n_emitted]
+            self.n_emitted += 1
+            try:
+                self.on_partial(chunks_to_result("".join(chunk["text"] for chunk in chunks).strip(), chunks, self.word_timestamps))
+            except Exception as e:
+                logging.log(logging.ERROR, f"Partial result callback of {self.audio_path} failed: {e}")
+
+    def set_window_count(self, n_windows):
+        with self.lock:
+            self.n_windows = n_windows
+            return self._maybe_finish()
+
+    def _maybe_finish(self):
+        if self.n_windows is None or self.n_done < self.n_windows or self.future.done():
+            return False
+        chunks = [chunk for i in range(self.n_windows) for chunk in self.chunks[i]]
+        self.future.set_result(chunks_to_result("".join(chunk["text"] for chunk in chunks).strip(), chunks, self.word_timestamps))
+        return True
+
+
+class BatchScheduler:
+    """
+    Dynamic batching in front of a loaded local Model.
+
+    Every submitted file is decoded into 30 s windows by its own reader thread.
+    A single inference thread collects windows from all in-flight requests and
+    runs a batch as soon as max_batch_size windows are waiting, or when the
+    oldest waiting window is max_wait_s old. Results are routed back to each
+    request, which resolves its future once all its windows are done.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait_s=0.2, chunk_length_s=30, stride_length_s=5, max_pending_windows=None):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_s
+        self.chunk_length_s = chunk_length_s
+        self.stride_length_s = stride_length_s
+        # Readers block when this many windows are waiting, which bounds memory
+        self._windows = queue.Queue(maxsize=max_pending_windows or max_batch_size * 4)
+        self._closed = threading.Event()
+        # Requests submitted and not resolved yet, the inference thread outlives close() until they are done
+        self._in_flight = 0
+        self._stopped = False
+        self._state_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._inference_loop, name="whisper-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, audio_path, word_timestamps=False, on_partial=None, blocks=None):
+        """
+        Queues a file for transcription.
+
+        Args:
+            audio_path (str): Path of the audio file
+            word_timestamps (bool): Timestamps of every word instead of every segment
+            on_partial (callable): Called from the inference thread with the result of
+                every window, in order, as soon as it is available
+            blocks (iterable): Decoded samples to transcribe instead of decoding audio_path,
+                e.g. from decode_stream while the file is downloaded
+
+        Returns:
+            concurrent.futures.Future: resolves to a {"text", "chunks"} dict
+            ({"text", "words"} with word timestamps)
+        """
+        request = _Request(audio_path, self.stride_length_s, word_timestamps, on_partial)
+        with self._state_lock:
+            if self._stopped:
+                raise RuntimeError(f"The scheduler of {self.model.model_name} is closed")
+            self._in_flight += 1
+        request.future.add_done_callback(self._request_done)
+        threading.Thread(target=self._read, args=(request, blocks), name="whisper-reader", daemon=True).start()
+        return request.future
+
+    def transcribe(self, audio_path, timeout=None, word_timestamps=False, on_partial=None):
+        """Blocking version of submit, the result is also stored in the model cache."""
+        result = self.submit(audio_path, word_timestamps, on_partial).result(timeout=timeout)
+        self.model.store_result(audio_path, result, word_timestamps)
+        return result
+
+    def close(self):
+        """Stops the inference thread once the requests already submitted are done."""
+        self._closed.set()
+
+    def _request_done(self, _):
+        with self._state_lock:
+            self._in_flight -= 1
+
+    def _read(self, request, blocks=None):
+        n_windows = 0
+        if blocks is None:
+            blocks = stream_audio(request.audio_path)
+        try:
+            for window in iter_windows(blocks, self.chunk_length_s, self.stride_length_s):
+                if request.future.done():
+                    return
+                self._windows.put((request, n_windows, window, time.monotonic()))
+                n_windows += 1
+        except Exception as e:
+            request.future.set_exception(e)
+            return
+        request.set_window_count(n_windows)
+
+    def _next_batch(self):
+        while True:
+            try:
+                batch = [self._windows.get(timeout=1.0)]
+                break
+            except queue.Empty:
+                with self._state_lock:
+                    if self._closed.is_set() and self._in_flight == 0:
+                        self._stopped = True
+                        return None
+        deadline = batch[0][3] + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._windows.get(timeout=timeout) if timeout > 0 else self._windows.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(entry)
+        return batch
+
+    def _inference_loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Windows of requests that already failed are dropped
+            batch = [entry for entry in batch if not entry[0].future.done()]
+            if not batch:
+                continue
+            # Word and segment timestamps need separate forward passes
+            for word_timestamps in sorted({entry[0].word_timestamps for entry in batch}):
+                self._run_batch([entry for entry in batch if entry[0].word_timestamps == word_timestamps], word_timestamps)
+
+    def _run_batch(self, batch, word_timestamps):
+        rss_token = get_rss_sampler().start()
+        batch_start = time.monotonic()
+        for request, _, _, queued_at in batch:
+            record("queue_wait", batch_start - queued_at, traces=[request.trace])
+        traces = list({id(request.trace): request.trace for request, _, _, _ in batch}.values())
+        span_attributes = {
+            "model": self.model.model_name,
+            "windows": len(batch),
+            "audio_seconds": sum(len(window.audio) for _, _, window, _ in batch) / SAMPLING_RATE,
+        }
+        try:
+            outputs = self.model.pipeline(
+                [{"raw": window.audio, "sampling_rate": SAMPLING_RATE} for _, _, window, _ in batch],
+                batch_size=len(batch),
+                return_timestamps="word" if word_timestamps else True,
+            )
+            record("inference", time.monotonic() - batch_start, traces=traces, peak_rss_bytes=get_rss_sampler().stop(rss_token), **span_attributes)
+        except Exception as e:
+            record("inference", time.monotonic() - batch_start, error=True, traces=traces, peak_rss_bytes=get_rss_sampler().stop(rss_token), **span_attributes)
+            logging.log(logging.ERROR, f"Batch of {len(batch)} windows failed: {e}")
+            for request, _, _, _ in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        for (request, index, window, _), output in zip(batch, outputs):
+            request.add_result(index, merge_window_chunks(window, output["chunks"], request.stride_length_s))
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def close_scheduler(key):
+    """Closes the scheduler of a registry key, e.g. when its model is evicted. Requests in flight still complete."""
+    with _schedulers_lock:
+        scheduler = _schedulers.pop(key, None)
+    if scheduler is not None:
+        scheduler.close()
+
+
+def get_scheduler(model):
+    """
+    Returns the process-wide scheduler of a loaded model, one per registry key,
+    configured from WHISPER_MAX_BATCH_SIZE (default 8) and WHISPER_MAX_BATCH_WAIT_MS (default 200).
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(model.key)
+        if scheduler is None or scheduler.model is not model:
+            if scheduler is not None:
+                # The registry reloaded this checkpoint
+                scheduler.close()
+            scheduler = BatchScheduler(
+                model,
+                max_batch_size=int(os.getenv("WHISPER_MAX_BATCH_SIZE", 8)),
+                max_wait_s=float(os.getenv("WHISPER_MAX_BATCH_WAIT_MS", 200)) / 1000,
+            )
+            _schedulers[model.key] = scheduler
+        return scheduler
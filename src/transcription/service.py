@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+
+from src.downloader.downloader import fetch_youtube_captions
+from src.transcription.api_model import ApiModel
+from src.transcription.local_model import Model
+from src.transcription.registry import get_registry
+from src.transcription.scheduler import get_scheduler
+from src.transcripts.store import get_transcript_store
+from src.utils.audio import transcode_for_whisper
+from src.utils.metrics import profiled, span
+from src.utils.vad import remap_result, remove_silence
+
+API_METHOD = "API (Groq)"
+LOCAL_METHOD = "Local (Whisper)"
+# Caption policies: only manual captions, or auto-generated ones too
+CAPTION_POLICIES = ["manual", "auto"]
+
+
+def method_backend(transcription_method):
+    """Groups transcription methods by the resource they use: "api" or "local"."""
+    return "api" if transcription_method == API_METHOD else "local"
+
+
+def index_transcript(result, source, title=None, kind=None, transcription_method=None, model_name=None):
+    """Adds a result to the searchable transcript store. Failures are only logged, they never fail a transcription."""
+    try:
+        get_transcript_store().add_transcript(source, result, title, kind, transcription_method, model_name)
+    except Exception as e:
+        logging.log(logging.ERROR, f"Indexing of {source} failed: {e}")
+
+
+def segments_to_result(segments, transcription_method, return_text_only=True):
+    """Formats {"start", "end", "text"} segments like the result of the given transcription method."""
+    text = " ".join(segment["text"] for segment in segments)
+    if transcription_method == API_METHOD:
+        if return_text_only:
+            return text
+        return json.dumps({"text": text, "segments": [dict(segment, id=i) for i, segment in enumerate(segments)]}, indent=2)
+    return {"text": text, "chunks": [{"timestamp": (segment["start"], segment["end"]), "text": " " + segment["text"]} for segment in segments]}
+
+
+def caption_result(youtube_url, transcription_method, language=None, return_text_only=True, options=None, stats=None):
+    """
+    Returns the YouTube captions of a video formatted like a transcription, when
+    options["captions"] is a caption policy ("manual" or "auto") and a track passes it.
+
+    Returns:
+        The result, or None when the audio has to be transcribed
+    """
+    options = options or {}
+    policy = options.get("captions")
+    if policy is None:
+        return None
+    assert policy in CAPTION_POLICIES, f"Invalid caption policy. Possible values are {CAPTION_POLICIES}, got {policy}"
+    captions = fetch_youtube_captions(youtube_url, language, allow_auto=policy == "auto")
+    if captions is None:
+        return None
+    if stats is not None:
+        stats["captions"] = captions["code"]
+    return segments_to_result(captions["segments"], transcription_method, return_text_only)
+
+
+def transcribe_audio(audio_path, transcription_method, model_name, language=None, return_text_only=True, options=None, stats=None, on_partial=None):
+    """
+    Transcribes a file with the Groq API or a local model, without any UI.
+    This is what the app, the background jobs and the CLI all run.
+
+    Args:
+        audio_path (str): Path of the audio file
+        transcription_method (str): API_METHOD or LOCAL_METHOD
+        model_name (str): Groq model or HuggingFace checkpoint name
+        language (str): Language code for the API (None to auto-detect)
+        return_text_only (bool): API only, return the text instead of the JSON result
+        options (dict): Method-specific settings: chunked and max_workers for the API,
+            backend and long_form for the local model. In long-form mode, the windows of
+            concurrent requests are batched together by the model's BatchScheduler.
+            With normalize, the audio is first transcoded to 16 kHz mono (Opus for
+            the API, FLAC locally, or normalize_format). With vad, silent regions
+            are removed before transcribing. With word_timestamps, every word is
+            timestamped ("words" in the result)
+        stats (dict): Filled with what the preprocessing saved: transcode_saved_bytes,
+            transcode_seconds and vad_skipped_seconds
+        on_partial (callable): Called with partial results, in order, as the windows
+            (local long-form) or chunks (chunked API) are transcribed, possibly from
+            another thread. Other modes and cached results call it once with the
+            whole result. See src.utils.subtitles.SubtitleStream
+
+    Every stage is recorded as a span (see src.utils.metrics), in the current
+    trace if there is one, and the call is profiled when WHISPER_PROFILE_DIR is set.
+
+    Returns:
+        str for the API (text or JSON), {"text", "chunks"} dict for the local model
+    """
+    options = options or {}
+    stats = stats if stats is not None else {}
+
+    with profiled("transcribe"), span("transcribe", method=method_backend(transcription_method), model=model_name):
+        if options.get("normalize"):
+            audio_format = options.get("normalize_format") or ("opus" if transcription_method == API_METHOD else "flac")
+            with span("transcode", format=audio_format) as s:
+                transcoded = transcode_for_whisper(audio_path, audio_format)
+                s.set(bytes=transcoded.transcoded_bytes)
+            stats["transcode_original_bytes"] = transcoded.original_bytes
+            stats["transcode_saved_bytes"] = transcoded.original_bytes - transcoded.transcoded_bytes
+            stats["transcode_seconds"] = transcoded.seconds
+            audio_path = transcoded.path
+
+        time_map = None
+        partials = []
+
+        def _on_partial(partial):
+            partials.append(True)
+            if time_map is not None:
+                partial = remap_result(partial, time_map)
+            on_partial(partial)
+
+        if options.get("vad"):
+            with span("vad") as s:
+                vad = remove_silence(audio_path)
+                s.set(audio_seconds=vad.speech_seconds + vad.skipped_seconds, skipped_seconds=vad.skipped_seconds)
+            stats["vad_skipped_seconds"] = vad.skipped_seconds
+            audio_path, time_map = vad.path, vad.time_map
+
+        result = _transcribe(audio_path, transcription_method, model_name, language, return_text_only, options, _on_partial if on_partial else None)
+    if time_map is not None:
+        # Timestamps refer to the speech-only audio until remapped
+        result = remap_result(result, time_map)
+    if on_partial is not None and not partials:
+        on_partial(result)
+    return result
+
+
+def _transcribe(audio_path, transcription_method, model_name, language, return_text_only, options, on_partial=None):
+    word_timestamps = options.get("word_timestamps", False)
+    if transcription_method == API_METHOD:
+        if "GROQ_API_KEY" not in os.environ:
+            raise RuntimeError("Please enter your Groq API key in the .env file or set GROQ_API_KEY environment variable.")
+
+        transcriber = ApiModel(
+            model_name=model_name,
+            timestamp_granularities=["word", "segment"] if word_timestamps else ["segment"],
+            language=language,
+            return_text_only=return_text_only
+        )
+        if options.get("chunked"):
+            return transcriber.transcribe_chunked(audio_path, max_workers=options.get("max_workers", 4), on_partial=on_partial)
+        return transcriber.transcribe(audio_path)
+
+    backend = options.get("backend", "eager")
+    # Previously transcribed audio does not need the model at all
+    result = Model(model_name, backend=backend).cached_result(audio_path, word_timestamps)
+    if result is not None:
+        return result
+
+    # Models are loaded once per process and shared between sessions
+    transcriber = get_registry().get_model(model_name, backend=backend)
+    if options.get("long_form", True):
+        return get_scheduler(transcriber).transcribe(audio_path, word_timestamps=word_timestamps, on_partial=on_partial)
+    return transcriber.transcribe([audio_path], word_timestamps)[0]
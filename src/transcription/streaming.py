@@ -0,0 +1,105 @@
+"""
+Speculative transcription: audio is transcribed while it is still being downloaded.
+
+The download runs in a thread and writes its file as usual. The bytes written so
+far are decoded by ffmpeg as they arrive (see follow_file and decode_stream), and
+30 s windows are transcribed as soon as they are decoded, so the first partial
+result arrives seconds after the download starts and the download and the
+inference overlap instead of running one after the other.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.downloader.downloader import follow_file
+from src.transcription.api_model import ApiModel
+from src.transcription.registry import get_registry
+from src.transcription.scheduler import get_scheduler
+from src.transcription.service import API_METHOD, method_backend, transcribe_audio
+from src.utils.audio import decode_stream
+from src.utils.metrics import record, run_in_context, span
+
+
+def transcribe_while_downloading(download, audio_path, transcription_method, model_name, language=None, return_text_only=True, options=None, stats=None, on_partial=None):
+    """
+    Downloads a file and transcribes it at the same time. Takes the arguments of
+    transcribe_audio, and returns the same result.
+
+    Streamed audio is decoded straight to 16 kHz mono, so normalize is not needed,
+    and vad, which needs the whole file, is not applied. Local windows go through
+    the model's BatchScheduler (long-form mode), API chunks are cut at silences and
+    uploaded as they are complete (chunked mode). If the file cannot be decoded
+    while it is downloaded (e.g. an MP4 with its index at the end) and nothing
+    was transcribed yet, it is transcribed with transcribe_audio once downloaded.
+
+    Args:
+        download (callable): Downloads the file to audio_path (through audio_path + ".part"),
+            not called if audio_path already exists
+        audio_path (str): Destination path of the download
+        stats (dict): Also filled with first_partial_seconds, the time from the start
+            of the download to the first partial result
+        on_partial (callable): Called with partial results, in order, possibly from another thread
+
+    Returns:
+        str for the API (text or JSON), {"text", "chunks"} dict for the local model
+    """
+    options = options or {}
+    stats = stats if stats is not None else {}
+    if os.path.exists(audio_path):
+        # Already downloaded, e.g. a job resumed after a restart
+        return transcribe_audio(audio_path, transcription_method, model_name, language, return_text_only, options, stats, on_partial)
+
+    start = time.monotonic()
+    partials = []
+
+    def _on_partial(partial):
+        if not partials:
+            stats["first_partial_seconds"] = time.monotonic() - start
+            record("first_partial", stats["first_partial_seconds"])
+        partials.append(True)
+        if on_partial is not None:
+            on_partial(partial)
+
+    done = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor, span("transcribe", method=method_backend(transcription_method), model=model_name, streaming=True):
+        download_future = run_in_context(executor, download)
+        download_future.add_done_callback(lambda _: done.set())
+        blocks = decode_stream(follow_file(audio_path, done), name=audio_path)
+        try:
+            result = _transcribe_stream(audio_path, blocks, transcription_method, model_name, language, return_text_only, options, _on_partial)
+        except Exception as e:
+            # A failed download is what made the decoding fail
+            download_future.result()
+            if partials:
+                raise
+            logging.log(logging.WARNING, f"Could not transcribe {audio_path} while downloading it, transcribing it once downloaded: {e}")
+            result = None
+        download_future.result()
+
+    if result is None:
+        return transcribe_audio(audio_path, transcription_method, model_name, language, return_text_only, options, stats, on_partial)
+    return result
+
+
+def _transcribe_stream(audio_path, blocks, transcription_method, model_name, language, return_text_only, options, on_partial):
+    word_timestamps = options.get("word_timestamps", False)
+    if transcription_method == API_METHOD:
+        if "GROQ_API_KEY" not in os.environ:
+            raise RuntimeError("Please enter your Groq API key in the .env file or set GROQ_API_KEY environment variable.")
+
+        transcriber = ApiModel(
+            model_name=model_name,
+            timestamp_granularities=["word", "segment"] if word_timestamps else ["segment"],
+            language=language,
+            return_text_only=return_text_only
+        )
+        return transcriber.transcribe_stream(audio_path, blocks, max_workers=options.get("max_workers", 4), on_partial=on_partial)
+
+    # The download keeps running while the model loads
+    transcriber = get_registry().get_model(model_name, backend=options.get("backend", "eager"))
+    result = get_scheduler(transcriber).submit(audio_path, word_timestamps, on_partial, blocks=blocks).result()
+    if os.path.exists(audio_path):
+        transcriber.store_result(audio_path, result, word_timestamps)
+    return result
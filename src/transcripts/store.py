@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import threading
+import time
+
+from src.utils.subtitles import result_to_segments
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL UNIQUE,
+    title TEXT,
+    kind TEXT,
+    method TEXT,
+    model TEXT,
+    duration REAL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transcript_id INTEGER NOT NULL REFERENCES transcripts (id) ON DELETE CASCADE,
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_transcript ON segments (transcript_id, start);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+def fts_query(text):
+    """
+    Turns free text into an FTS5 query matching segments that contain all the
+    words, so that user input never hits the FTS5 query syntax. Quoted parts
+    are kept as phrases and a trailing * makes the last word a prefix.
+    """
+    parts = text.split('"')
+    terms = []
+    for i, part in enumerate(parts):
+        if i % 2 == 1 and part.strip():
+            terms.append('"' + part.strip() + '"')
+        else:
+            for word in part.split():
+                prefix = word.endswith("*")
+                word = word.rstrip("*").replace('"', "")
+                if word:
+                    terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class TranscriptStore:
+    """
+    Persistent store of transcripts in SQLite, with a full-text index (FTS5)
+    over their timestamped segments.
+
+    A transcript is identified by its source (URL or path), transcribing the same
+    source again replaces it.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def add_transcript(self, source, result, title=None, kind=None, method=None, model=None):
+        """
+        Stores the segments of a transcription result of either backend.
+
+        Args:
+            source (str): URL or path of the audio
+            result: Transcription result (see result_to_segments)
+            title (str): Display name
+            kind (str): "youtube", "podcast" or "file"
+            method (str): Transcription method
+            model (str): Model name
+
+        Returns:
+            int: the transcript id
+        """
+        segments = [segment for segment in result_to_segments(result) if segment["text"]]
+        duration = max((segment["end"] or 0 for segment in segments), default=None)
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM transcripts WHERE source = ?", (source,))
+            cursor = conn.execute(
+                "INSERT INTO transcripts (source, title, kind, method, model, duration, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, title or os.path.basename(source), kind, method, model, duration, time.time()),
+            )
+            transcript_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO segments (transcript_id, start, end, text) VALUES (?, ?, ?, ?)",
+                [(transcript_id, segment["start"], segment["end"], segment["text"]) for segment in segments],
+            )
+        return transcript_id
+
+    def search(self, query, limit=20):
+        """
+        Finds the segments matching a query, best matches first.
+
+        Args:
+            query (str): Words to look for, see fts_query
+
+        Returns:
+            list: {"transcript_id", "title", "source", "start", "end", "text", "snippet"} dicts,
+            the snippet highlighting the matches in **bold**
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT s.transcript_id, t.title, t.source, s.start, s.end, s.text, "
+                "snippet(segments_fts, 0, '**', '**', '…', 16) AS snippet "
+                "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+                "JOIN transcripts t ON t.id = s.transcript_id "
+                "WHERE segments_fts MATCH ? ORDER BY bm25(segments_fts) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_transcripts(self, limit=100):
+        """Most recent transcripts first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT t.*, COUNT(s.id) AS segments FROM transcripts t LEFT JOIN segments s ON s.transcript_id = t.id "
+                "GROUP BY t.id ORDER BY t.id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_segments(self, transcript_id):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT start, end, text FROM segments WHERE transcript_id = ? ORDER BY start, id", (transcript_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, transcript_id):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM transcripts WHERE id = ?", (transcript_id,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_transcript_store():
+    """Returns the process-wide transcript store, in TRANSCRIPTS_DB_PATH (default ./data/transcripts.db)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TranscriptStore(os.getenv("TRANSCRIPTS_DB_PATH", "./data/transcripts.db"))
+        return _store
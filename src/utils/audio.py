@@ -0,0 +1,373 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+
+# A fixed-length slice of decoded audio; start is in seconds from the beginning of the file
+Window = namedtuple("Window", ["start", "audio", "is_first", "is_last"])
+
+
+def stream_audio(path, sampling_rate=SAMPLING_RATE, block_length_s=10):
+    """
+    Decodes an audio file with ffmpeg into mono float32 blocks,
+    without ever holding the whole decoded file in memory.
+
+    Args:
+        path (str): Path of any file ffmpeg can read
+        sampling_rate (int): Output sampling rate
+        block_length_s (float): Duration of each yielded block
+
+    Yields:
+        np.ndarray: float32 samples
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-i", path,
+        "-f", "f32le", "-ac", "1", "-ar", str(sampling_rate),
+        "pipe:1",
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    yield from _read_blocks(process, int(block_length_s * sampling_rate) * 4, path)
+
+
+def decode_stream(chunks, sampling_rate=SAMPLING_RATE, block_length_s=10, name="stream"):
+    """
+    Like stream_audio, for a file that arrives as a stream of bytes (e.g. while it
+    is downloaded, see follow_file). The bytes are fed to ffmpeg's stdin from
+    another thread, so blocks are yielded as soon as enough audio has arrived.
+
+    Containers that need to seek cannot be decoded from a stream, ffmpeg fails
+    on MP4 files whose index is written at the end.
+
+    Args:
+        chunks (iterable): bytes of the file, in order
+        name (str): What is decoded, for the error messages
+
+    Yields:
+        np.ndarray: float32 samples
+    """
+    cmd = [
+        "ffmpeg", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(sampling_rate),
+        "pipe:1",
+    ]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = []
+
+    def _feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            # ffmpeg stopped reading, its own error is raised by the reader
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=_feed, name="ffmpeg-feeder", daemon=True)
+    feeder.start()
+    yield from _read_blocks(process, int(block_length_s * sampling_rate) * 4, name)
+    feeder.join()
+    if errors:
+        raise errors[0]
+
+
+def _read_blocks(process, bytes_per_block, name):
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(bytes_per_block)
+            if not data:
+                break
+            # A read can end on a partial sample only at EOF
+            data = data[: len(data) - len(data) % 4]
+            yield np.frombuffer(data, dtype=np.float32)
+        finished = True
+    finally:
+        process.stdout.close()
+        if not finished:
+            process.kill()
+        process.wait()
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {name}: {stderr.strip()}")
+
+
+def iter_windows(blocks, chunk_length_s=30, stride_length_s=5, sampling_rate=SAMPLING_RATE):
+    """
+    Regroups a stream of sample blocks into fixed windows that overlap by stride_length_s.
+
+    Args:
+        blocks (iterable): np.ndarray blocks, e.g. from stream_audio
+        chunk_length_s (float): Window duration (Whisper works on 30 s)
+        stride_length_s (float): Overlap between consecutive windows
+
+    Yields:
+        Window: the next window, flagged if it is the first/last of the stream
+    """
+    chunk = int(chunk_length_s * sampling_rate)
+    step = chunk - int(stride_length_s * sampling_rate)
+    if step <= 0:
+        raise ValueError("stride_length_s must be smaller than chunk_length_s")
+
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0
+    pending = None
+    for block in blocks:
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) >= chunk:
+            if pending is not None:
+                yield Window(pending[0] / sampling_rate, pending[1], pending[0] == 0, False)
+            pending = (offset, buffer[:chunk].copy())
+            buffer = buffer[step:]
+            offset += step
+
+    # Whatever is left was only partially covered by the previous window
+    if len(buffer) > (chunk - step if pending is not None else 0):
+        if pending is not None:
+            yield Window(pending[0] / sampling_rate, pending[1], pending[0] == 0, False)
+        pending = (offset, buffer)
+    if pending is not None:
+        yield Window(pending[0] / sampling_rate, pending[1], pending[0] == 0, True)
+
+
+def iter_chunks(blocks, chunk_length_s=30, search_window_s=5, frame_length_s=0.1, sampling_rate=SAMPLING_RATE):
+    """
+    Regroups a stream of sample blocks into consecutive chunks of at most
+    chunk_length_s, each one cut at the quietest frame of its last search_window_s.
+    This is find_split_points for audio that is still arriving: every chunk is
+    yielded as soon as it is complete.
+
+    Yields:
+        tuple: (start in seconds, np.ndarray samples)
+    """
+    chunk = int(chunk_length_s * sampling_rate)
+    frame = int(frame_length_s * sampling_rate)
+    n_frames = min(int(search_window_s * sampling_rate), chunk // 2) // frame
+
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0
+    for block in blocks:
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) >= chunk:
+            cut = chunk
+            if n_frames:
+                search_start = chunk - n_frames * frame
+                frames = buffer[search_start:chunk].reshape(n_frames, frame)
+                cut = search_start + int(np.argmin(np.mean(frames ** 2, axis=1))) * frame
+            yield offset / sampling_rate, buffer[:cut].copy()
+            buffer = buffer[cut:]
+            offset += cut
+    if len(buffer):
+        yield offset / sampling_rate, buffer
+
+
+def frame_energies(path, frame_length_s=0.1, sampling_rate=SAMPLING_RATE):
+    """
+    Streams a file and computes the RMS energy (in dB) of consecutive frames.
+    Memory only grows with the number of frames, e.g. 72000 floats for 2 hours.
+
+    Returns:
+        np.ndarray: one energy value per frame_length_s of audio
+    """
+    frame = int(frame_length_s * sampling_rate)
+    energies = []
+    remainder = np.zeros(0, dtype=np.float32)
+    for block in stream_audio(path, sampling_rate=sampling_rate):
+        samples = np.concatenate([remainder, block])
+        n_frames = len(samples) // frame
+        remainder = samples[n_frames * frame:]
+        if n_frames:
+            frames = samples[: n_frames * frame].reshape(n_frames, frame)
+            energies.append(np.sqrt(np.mean(frames ** 2, axis=1)))
+    if len(remainder):
+        energies.append(np.sqrt(np.mean(remainder ** 2, keepdims=True)))
+    if not energies:
+        return np.zeros(0, dtype=np.float32)
+    return 20 * np.log10(np.concatenate(energies) + 1e-10)
+
+
+def find_split_points(energies, max_chunk_s, frame_length_s=0.1, search_window_s=30):
+    """
+    Splits the timeline into chunks no longer than max_chunk_s, cutting each one
+    at the quietest frame of the last search_window_s before the limit.
+
+    Args:
+        energies (np.ndarray): Frame energies from frame_energies
+        max_chunk_s (float): Maximum chunk duration
+        frame_length_s (float): Frame duration used for the energies
+
+    Returns:
+        list: (start, end) tuples in seconds covering the whole file
+    """
+    duration = len(energies) * frame_length_s
+    max_frames = int(max_chunk_s / frame_length_s)
+    search_frames = max(1, min(int(search_window_s / frame_length_s), max_frames // 2))
+
+    chunks = []
+    start = 0
+    while start + max_frames < len(energies):
+        search_start = start + max_frames - search_frames
+        cut = search_start + int(np.argmin(energies[search_start: start + max_frames]))
+        chunks.append((round(start * frame_length_s, 3), round(cut * frame_length_s, 3)))
+        start = cut
+    if start * frame_length_s < duration or not chunks:
+        chunks.append((round(start * frame_length_s, 3), round(duration, 3)))
+    return chunks
+
+
+def encode_segment(path, start, duration, audio_format="flac", sampling_rate=SAMPLING_RATE):
+    """
+    Extracts [start, start + duration) from a file as 16 kHz mono audio.
+
+    Returns:
+        bytes: the encoded segment
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-ss", f"{start:.3f}", "-t", f"{duration:.3f}",
+        "-i", path,
+        "-ac", "1", "-ar", str(sampling_rate),
+        "-f", audio_format, "pipe:1",
+    ]
+    process = subprocess.run(cmd, capture_output=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not extract {start}s-{start + duration}s of {path}: {process.stderr.decode(errors='replace').strip()}")
+    return process.stdout
+
+
+def encode_samples(samples, audio_format="flac", sampling_rate=SAMPLING_RATE):
+    """
+    Encodes mono float32 samples, e.g. a chunk from iter_chunks.
+
+    Returns:
+        bytes: the encoded audio
+    """
+    cmd = [
+        "ffmpeg", "-loglevel", "error",
+        "-f", "f32le", "-ac", "1", "-ar", str(sampling_rate), "-i", "pipe:0",
+        "-f", audio_format, "pipe:1",
+    ]
+    process = subprocess.run(cmd, input=np.asarray(samples, dtype=np.float32).tobytes(), capture_output=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not encode {len(samples) / sampling_rate:.1f}s of audio: {process.stderr.decode(errors='replace').strip()}")
+    return process.stdout
+
+
+def probe_duration(path):
+    """Returns the duration of a media file in seconds, read with ffprobe."""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        path,
+    ]
+    process = subprocess.run(cmd, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffprobe could not read {path}: {process.stderr.strip()}")
+    return float(process.stdout.strip())
+
+
+def write_audio(blocks, output_path, sampling_rate=SAMPLING_RATE):
+    """
+    Encodes a stream of mono float32 blocks to a file with ffmpeg,
+    the format is chosen from the extension of output_path.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-f", "f32le", "-ac", "1", "-ar", str(sampling_rate), "-i", "pipe:0",
+        output_path,
+    ]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for block in blocks:
+            process.stdin.write(np.asarray(block, dtype=np.float32).tobytes())
+    finally:
+        process.stdin.close()
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not write {output_path}: {stderr.strip()}")
+
+
+TRANSCODE_FORMATS = {
+    # Lossless, avoids any resampling or decoding artifacts for the local model
+    "flac": (".16k.flac", ["-c:a", "flac"]),
+    # Around 4x smaller than a 128 kbps MP3, plenty for speech recognition
+    "opus": (".16k.ogg", ["-c:a", "libopus", "-b:a", "32k", "-application", "voip"]),
+}
+
+TranscodeResult = namedtuple("TranscodeResult", ["path", "original_bytes", "transcoded_bytes", "seconds", "reused"])
+
+# Written next to their sources: transcoded copies, the speech-only audio of
+# src.utils.vad.remove_silence with its regions, and unfinished downloads or transcodes
+DERIVED_SUFFIXES = tuple(suffix for suffix, _ in TRANSCODE_FORMATS.values()) + (".speech.flac", ".speech.flac.json", ".part")
+
+
+def is_derived_file(path):
+    """Whether path is a file written from another one (see DERIVED_SUFFIXES) rather than a source."""
+    return path.lower().endswith(DERIVED_SUFFIXES)
+
+
+def transcode_for_whisper(path, audio_format="flac", sampling_rate=SAMPLING_RATE):
+    """
+    Transcodes a file once to 16 kHz mono, the input Whisper works with, and
+    keeps the result next to the source (e.g. episode.16k.flac). Later calls
+    reuse it as long as it is newer than the source.
+
+    Args:
+        path (str): Path of the source file
+        audio_format (str): "flac" or "opus"
+
+    Returns:
+        TranscodeResult: the transcoded path, the sizes before and after,
+        the seconds spent transcoding and whether an existing file was reused
+    """
+    if audio_format not in TRANSCODE_FORMATS:
+        raise ValueError(f"Invalid format. Possible values are {list(TRANSCODE_FORMATS)}, got {audio_format}")
+    suffix, codec_args = TRANSCODE_FORMATS[audio_format]
+    original_bytes = os.path.getsize(path)
+    if path.lower().endswith(suffix):
+        # Already transcoded, e.g. episode.16k.flac picked from the downloads
+        return TranscodeResult(path, original_bytes, original_bytes, 0.0, True)
+    output_path = os.path.splitext(path)[0] + suffix
+
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(path):
+        return TranscodeResult(output_path, original_bytes, os.path.getsize(output_path), 0.0, True)
+
+    start = time.monotonic()
+    tmp_path = output_path + ".part"
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-i", path,
+        "-vn", "-ac", "1", "-ar", str(sampling_rate),
+        *codec_args,
+        "-f", "flac" if audio_format == "flac" else "ogg",
+        tmp_path,
+    ]
+    process = subprocess.run(cmd, capture_output=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not transcode {path}: {process.stderr.decode(errors='replace').strip()}")
+    os.replace(tmp_path, output_path)
+    seconds = time.monotonic() - start
+
+    result = TranscodeResult(output_path, original_bytes, os.path.getsize(output_path), seconds, False)
+    logging.log(
+        logging.INFO,
+        f"Transcoded {path} in {seconds:.1f}s: {original_bytes / 1e6:.1f} MB -> {result.transcoded_bytes / 1e6:.1f} MB"
+    )
+    return result
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+def hash_file(path, block_size=1024 * 1024):
+    """Streams a file through SHA-256, one block at a time."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Persistent cache of transcription results, keyed by the content of the
+    audio file and the transcription parameters.
+
+    Every entry is a JSON file in cache_dir. Reading an entry refreshes its
+    modification time, and when the directory grows beyond max_bytes the least
+    recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=500 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # (path, size, mtime) -> content hash, so a file is read once per process
+        self._hashes = {}
+
+    def content_hash(self, audio_path):
+        stat = os.stat(audio_path)
+        file_id = (os.path.abspath(audio_path), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self._hashes:
+            self._hashes[file_id] = hash_file(audio_path)
+        return self._hashes[file_id]
+
+    def make_key(self, audio_path, params):
+        """
+        Args:
+            audio_path (str): Path of the audio file
+            params (dict): Everything that changes the result (model_name, language, ...)
+
+        Returns:
+            str: the cache key
+        """
+        payload = json.dumps({"audio": self.content_hash(audio_path), "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        logging.log(logging.INFO, f"Transcription cache hit {key[:12]}")
+        return value
+
+    def set(self, key, value):
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide transcription cache, configured from
+    TRANSCRIPTION_CACHE_DIR (default ./cache/transcriptions) and
+    TRANSCRIPTION_CACHE_MAX_MB (default 500).
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranscriptionCache(
+                os.getenv("TRANSCRIPTION_CACHE_DIR", "./cache/transcriptions"),
+                max_bytes=int(float(os.getenv("TRANSCRIPTION_CACHE_MAX_MB", 500)) * 1024 * 1024),
+            )
+        return _cache
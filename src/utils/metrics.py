@@ -0,0 +1,333 @@
+import contextlib
+import contextvars
+import cProfile
+import itertools
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def process_peak_rss_bytes():
+    """High-water mark of the resident memory over the whole lifetime of the process."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def current_rss_bytes():
+    """Resident memory of the process right now, None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class RssSampler:
+    """
+    Samples the resident memory of the process every `interval` seconds while
+    at least one measurement is open, so that each span gets the peak reached
+    during its own run rather than the high-water mark of the process. The
+    memory is the process's: spans running at the same time see each other's
+    allocations.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self._peaks = {}
+        self._tokens = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Opens a measurement, returns its token (None if RSS cannot be read)."""
+        rss = current_rss_bytes()
+        if rss is None:
+            return None
+        with self._lock:
+            token = next(self._tokens)
+            self._peaks[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+        return token
+
+    def stop(self, token):
+        """Closes a measurement, returns the peak RSS in bytes since its start."""
+        if token is None:
+            return None
+        rss = current_rss_bytes() or 0
+        with self._lock:
+            return max(self._peaks.pop(token, 0), rss)
+
+    def _run(self):
+        while True:
+            rss = current_rss_bytes() or 0
+            with self._lock:
+                if not self._peaks:
+                    # Restarted by the next start
+                    self._thread = None
+                    return
+                for token, peak in self._peaks.items():
+                    if rss > peak:
+                        self._peaks[token] = rss
+            time.sleep(self.interval)
+
+
+class Metrics:
+    """
+    Per-stage counters and duration histograms of the process, rendered in the
+    Prometheus text format. Stages are e.g. download, api_request, model_load,
+    inference, queue_wait, transcode, vad and transcribe.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, bytes=0, audio_seconds=0, error=False):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {
+                    "count": 0, "errors": 0, "seconds": 0.0, "bytes": 0, "audio_seconds": 0.0,
+                    "buckets": [0] * len(self.buckets),
+                }
+            stats["count"] += 1
+            stats["errors"] += int(error)
+            stats["seconds"] += seconds
+            stats["bytes"] += bytes
+            stats["audio_seconds"] += audio_seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: dict(stats, buckets=list(stats["buckets"])) for stage, stats in self._stages.items()}
+
+    def render(self):
+        stages = self.snapshot()
+        lines = [
+            "# HELP whisper_stage_seconds Time spent in each stage.",
+            "# TYPE whisper_stage_seconds histogram",
+        ]
+        for stage, stats in stages.items():
+            for bound, count in zip(self.buckets, stats["buckets"]):
+                lines.append(f'whisper_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'whisper_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'whisper_stage_seconds_sum{{stage="{stage}"}} {stats["seconds"]}')
+            lines.append(f'whisper_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for name, key, help_text in [
+            ("whisper_stage_errors_total", "errors", "Stages that raised an exception."),
+            ("whisper_stage_bytes_total", "bytes", "Bytes downloaded, uploaded or written by each stage."),
+            ("whisper_stage_audio_seconds_total", "audio_seconds", "Seconds of audio processed by each stage."),
+        ]:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage, stats in stages.items():
+                lines.append(f'{name}{{stage="{stage}"}} {stats[key]}')
+        lines.append("# HELP process_peak_rss_bytes High-water mark of the resident memory since the process started.")
+        lines.append("# TYPE process_peak_rss_bytes gauge")
+        lines.append(f"process_peak_rss_bytes {process_peak_rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """The spans recorded while working on one job or request, in completion order."""
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, span_record):
+        with self._lock:
+            self.spans.append(span_record)
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {"name": self.name, "seconds": round(time.monotonic() - self._start, 3), "spans": spans}
+
+
+class Span:
+    """Attributes of a running span, e.g. bytes and audio_seconds once they are known."""
+
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+_metrics = Metrics()
+_rss_sampler = RssSampler()
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+def get_metrics():
+    """Returns the process-wide metrics."""
+    return _metrics
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def get_rss_sampler():
+    """Returns the process-wide RssSampler used by span."""
+    return _rss_sampler
+
+
+def record(stage, seconds, error=False, traces=None, **attributes):
+    """
+    Records a finished stage in the metrics and in traces (the current one by default).
+
+    Args:
+        stage (str): Stage name
+        seconds (float): Duration
+        error (bool): Whether the stage failed
+        traces (list): Traces to add the span to, for work done on behalf of
+            other threads (e.g. a batch of the BatchScheduler)
+        **attributes: bytes and audio_seconds are aggregated, anything else is only traced
+            (e.g. peak_rss_bytes, see RssSampler)
+    """
+    _metrics.observe(stage, seconds, attributes.get("bytes", 0), attributes.get("audio_seconds", 0), error)
+    if traces is None:
+        traces = [_current_trace.get()]
+    span_record = dict(
+        attributes,
+        stage=stage,
+        seconds=round(seconds, 4),
+        error=error,
+        thread=threading.current_thread().name,
+    )
+    for trace in traces:
+        if trace is not None:
+            trace.add(span_record)
+
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    """
+    Times a block as a stage, and records the peak RSS reached while it ran as
+    peak_rss_bytes. Attributes known only at the end are added with Span.set.
+
+    Example:
+        with span("download", url=url) as s:
+            s.set(bytes=download())
+    """
+    current = Span(stage, attributes)
+    rss_token = _rss_sampler.start()
+    start = time.perf_counter()
+    error = False
+    try:
+        yield current
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        peak = _rss_sampler.stop(rss_token)
+        if peak is not None:
+            current.set(peak_rss_bytes=peak)
+        record(stage, seconds, error=error, **current.attributes)
+        logging.log(logging.DEBUG, f"{stage} took {seconds:.3f}s {current.attributes}")
+
+
+@contextlib.contextmanager
+def trace(name):
+    """Collects the spans recorded in this context (and the contexts copied from it) into a Trace."""
+    new_trace = Trace(name)
+    token = _current_trace.set(new_trace)
+    try:
+        yield new_trace
+    finally:
+        _current_trace.reset(token)
+
+
+def run_in_context(executor, fn, *args):
+    """executor.submit, with the spans of fn recorded in the current trace."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+_profile_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def profiled(name):
+    """
+    Runs a block under cProfile when WHISPER_PROFILE_DIR is set, and writes
+    <WHISPER_PROFILE_DIR>/<name>-<timestamp>.prof (open with snakeviz or pstats).
+    cProfile only sees the calling thread and only one profile runs at a time,
+    concurrent blocks are not profiled. For a whole-process view, py-spy can be
+    attached to the running process instead, the worker threads are named.
+    """
+    profile_dir = os.getenv("WHISPER_PROFILE_DIR")
+    if not profile_dir or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f"{name}-{int(time.time())}.prof")
+            profiler.dump_stats(path)
+            logging.log(logging.INFO, f"Profile of {name} written to {path}")
+    finally:
+        _profile_lock.release()
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """
+    Serves the metrics at http://<host>:<port>/metrics from a background thread,
+    once per process.
+    """
+    global _server
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            logging.log(logging.INFO, f"Serving metrics on port {port}")
+        return _server
+
+
+def start_metrics_server_from_env():
+    """Starts the metrics server if METRICS_PORT is set."""
+    port = os.getenv("METRICS_PORT")
+    if port:
+        start_metrics_server(int(port))
@@ -0,0 +1,282 @@
+import functools
+import io
+import json
+import math
+import re
+import textwrap
+
+SUBTITLE_FORMATS = ["srt", "vtt", "jsonl"]
+SENTENCE_ENDS = (".", "?", "!", "…")
+
+
+def parse_verbose_json(result):
+    """
+    Parses an API result string as verbose_json.
+
+    Returns:
+        dict or None: the parsed result, None for plain text (including text such
+        as "42" or "null", which is valid JSON too but not a verbose_json object)
+    """
+    try:
+        data = json.loads(result)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _load(result):
+    if isinstance(result, str):
+        data = parse_verbose_json(result)
+        return data if data is not None else {"text": result}
+    if isinstance(result, list):
+        # Output of Model.transcribe for a single file
+        return result[0]
+    return result
+
+
+def result_to_segments(result):
+    """
+    Converts the result of either backend to a list of {"start", "end", "text"} segments.
+
+    Args:
+        result: local model output ({"text", "chunks"} or {"text", "words"}), API
+            verbose_json (dict or JSON string) or plain text (a single segment
+            without timestamps)
+
+    Returns:
+        list: segments with times in seconds (None when unknown)
+    """
+    result = _load(result)
+    if "chunks" in result:
+        return [
+            {"start": chunk["timestamp"][0], "end": chunk["timestamp"][1], "text": chunk["text"].strip()}
+            for chunk in result["chunks"]
+        ]
+    if result.get("segments"):
+        return [
+            {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+            for segment in result["segments"]
+        ]
+    if result.get("words"):
+        # Word timestamps only: sentences (or runs of words between pauses) become segments
+        return build_cues(words=result_to_words(result), max_chars=None, max_duration=30.0)
+    return [{"start": None, "end": None, "text": result.get("text", "").strip()}]
+
+
+def result_to_words(result):
+    """
+    Returns the word timestamps of a result as {"start", "end", "text"} dicts,
+    or an empty list if it has none.
+    """
+    result = _load(result)
+    return [
+        {"start": word["start"], "end": word["end"], "text": word["word"].strip()}
+        for word in result.get("words") or []
+        if word["word"].strip()
+    ]
+
+
+def segments_to_words(segments):
+    """
+    Approximates the words of segments without word timestamps, spreading the
+    duration of each segment over its words in proportion to their length.
+    """
+    words = []
+    for segment in segments:
+        tokens = segment["text"].split()
+        if not tokens:
+            continue
+        start = segment["start"] or 0.0
+        end = segment["end"] if segment["end"] is not None else start
+        total_chars = sum(len(token) for token in tokens)
+        position = start
+        for token in tokens:
+            duration = (end - start) * len(token) / total_chars
+            words.append({"start": round(position, 3), "end": round(position + duration, 3), "text": token})
+            position += duration
+    return words
+
+
+class CueBuilder:
+    """
+    Groups timed words into subtitle cues as they arrive, calling on_cue with
+    every {"start", "end", "text"} cue once it is complete.
+
+    A cue is closed when the next word would make it longer than max_chars or
+    max_duration, after a pause longer than max_gap, or at the end of a sentence
+    once it lasts at least min_duration.
+    """
+
+    def __init__(self, on_cue, max_chars=84, max_duration=6.0, max_gap=1.0, min_duration=1.0):
+        self.on_cue = on_cue
+        self.max_chars = max_chars
+        self.max_duration = max_duration
+        self.max_gap = max_gap
+        self.min_duration = min_duration
+        self._cue = None
+
+    def add(self, word):
+        cue = self._cue
+        if cue is not None:
+            text = cue["text"] + " " + word["text"]
+            if (
+                (self.max_chars is not None and len(text) > self.max_chars)
+                or word["end"] - cue["start"] > self.max_duration
+                or word["start"] - cue["end"] > self.max_gap
+            ):
+                self.flush()
+            else:
+                cue["text"], cue["end"] = text, word["end"]
+        if self._cue is None:
+            self._cue = {"start": word["start"], "end": word["end"], "text": word["text"]}
+        if self._cue["text"].endswith(SENTENCE_ENDS) and self._cue["end"] - self._cue["start"] >= self.min_duration:
+            self.flush()
+
+    def flush(self):
+        if self._cue is not None:
+            self.on_cue(self._cue)
+            self._cue = None
+
+
+def build_cues(segments=None, words=None, max_chars=84, max_duration=6.0):
+    """
+    Splits and merges segments into subtitle cues, using word timestamps when
+    there are some and approximating them from the segments otherwise.
+
+    Returns:
+        list: {"start", "end", "text"} cues
+    """
+    cues = []
+    builder = CueBuilder(cues.append, max_chars=max_chars, max_duration=max_duration)
+    for word in words or segments_to_words(segments or []):
+        builder.add(word)
+    builder.flush()
+    return cues
+
+
+def parse_timestamp(timestamp):
+    """Parses HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (WebVTT) into seconds."""
+    hours, minutes, seconds = timestamp.strip().replace(",", ".").split(":")
+    return round(int(hours) * 3600 + int(minutes) * 60 + float(seconds), 3)
+
+
+def parse_srt(text):
+    """
+    Parses SRT subtitles into {"start", "end", "text"} segments, the lines of a
+    cue being joined with spaces.
+    """
+    segments = []
+    for block in re.split(r"\n\s*\n", text.replace("\r\n", "\n").strip()):
+        lines = block.split("\n")
+        for i, line in enumerate(lines):
+            if "-->" in line:
+                start, end = line.split("-->")
+                segments.append({
+                    "start": parse_timestamp(start),
+                    "end": parse_timestamp(end.split()[0]),
+                    "text": " ".join(line.strip() for line in lines[i + 1:] if line.strip()),
+                })
+                break
+    return segments
+
+
+def wrap_lines(text, max_line_length):
+    """Wraps text into as few lines of at most max_line_length characters as possible, of balanced lengths."""
+    # URLs and other long tokens are kept whole, even if their line is too long
+    wrap = functools.partial(textwrap.wrap, break_long_words=False, break_on_hyphens=False)
+    lines = wrap(text, max_line_length)
+    if len(lines) <= 1:
+        return text
+    for width in range(math.ceil(len(text) / len(lines)), max_line_length):
+        balanced = wrap(text, width)
+        if len(balanced) <= len(lines):
+            return "\n".join(balanced)
+    return "\n".join(lines)
+
+
+def format_timestamp(seconds, separator=","):
+    """Formats seconds as HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (WebVTT, separator=".")."""
+    milliseconds = int(round((seconds or 0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+class SubtitleWriter:
+    """
+    Appends cues (or segments) to an open text file in one of SUBTITLE_FORMATS,
+    flushing after every cue so a partial file can already be used.
+    Lines longer than max_line_length are wrapped.
+    """
+
+    def __init__(self, f, subtitle_format, max_line_length=None):
+        assert subtitle_format in SUBTITLE_FORMATS, f"Invalid subtitle format. Possible values are {SUBTITLE_FORMATS}, got {subtitle_format}"
+        self.f = f
+        self.subtitle_format = subtitle_format
+        self.max_line_length = max_line_length
+        self.count = 0
+        if subtitle_format == "vtt":
+            f.write("WEBVTT\n\n")
+
+    def _text(self, text):
+        return text if self.max_line_length is None else wrap_lines(text, self.max_line_length)
+
+    def write(self, cue):
+        self.count += 1
+        if self.subtitle_format == "jsonl":
+            self.f.write(json.dumps(cue, ensure_ascii=False) + "\n")
+        elif self.subtitle_format == "srt":
+            self.f.write(f"{self.count}\n{format_timestamp(cue['start'])} --> {format_timestamp(cue['end'])}\n{self._text(cue['text'])}\n\n")
+        else:
+            self.f.write(f"{format_timestamp(cue['start'], '.')} --> {format_timestamp(cue['end'], '.')}\n{self._text(cue['text'])}\n\n")
+        self.f.flush()
+
+
+def _format(segments, subtitle_format, max_line_length=None):
+    f = io.StringIO()
+    writer = SubtitleWriter(f, subtitle_format, max_line_length)
+    for segment in segments:
+        writer.write(segment)
+    return f.getvalue()
+
+
+def format_srt(segments, max_line_length=None):
+    return _format(segments, "srt", max_line_length)
+
+
+def format_vtt(segments, max_line_length=None):
+    return _format(segments, "vtt", max_line_length)
+
+
+def format_jsonl(segments):
+    return _format(segments, "jsonl")
+
+
+def result_to_subtitles(result, subtitle_format, max_line_length=42, max_lines=2, max_duration=6.0):
+    """Formats a whole result as SRT or WebVTT cues of at most max_lines lines of max_line_length characters."""
+    cues = build_cues(result_to_segments(result), result_to_words(result), max_line_length * max_lines, max_duration)
+    return _format(cues, subtitle_format, max_line_length)
+
+
+class SubtitleStream:
+    """
+    Writes subtitles while a file is being transcribed: partial results (see the
+    on_partial argument of transcribe_audio) are turned into cues, and every cue is
+    written to all the writers as soon as it is complete. close() writes the last one.
+    """
+
+    def __init__(self, writers, max_line_length=42, max_lines=2, max_duration=6.0):
+        self.writers = writers
+        self._builder = CueBuilder(self._write, max_chars=max_line_length * max_lines, max_duration=max_duration)
+
+    def _write(self, cue):
+        for writer in self.writers:
+            writer.write(cue)
+
+    def add(self, partial):
+        for word in result_to_words(partial) or segments_to_words(result_to_segments(partial)):
+            self._builder.add(word)
+
+    def close(self):
+        self._builder.flush()
@@ -8,4 +8,27 @@ def get_safe_file_name(title):
     # Replace invalid characters with underscores
     safe_title = re.sub(r'[^\w\-_.]', '_', title).lower()
         
-    return safe_title
\ No newline at end of file
+    return safe_title
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word-level edit distance between two transcripts, divided by the
+    number of reference words. Case and punctuation are ignored.
+    """
+    ref_words = re.sub(r'[^\w\s]', '', reference.lower()).split()
+    hyp_words = re.sub(r'[^\w\s]', '', hypothesis.lower()).split()
+    if not ref_words:
+        return 0.0 if not hyp_words else 1.0
+
+    # Levenshtein distance, keeping only the previous row
+    previous = list(range(len(hyp_words) + 1))
+    for i, ref_word in enumerate(ref_words, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp_words, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            ))
+        previous = current
+    return previous[-1] / len(ref_words)
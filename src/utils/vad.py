@@ -0,0 +1,170 @@
+import bisect
+import json
+import logging
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from src.utils.audio import SAMPLING_RATE, frame_energies, stream_audio, write_audio
+from src.utils.subtitles import parse_verbose_json
+
+FRAME_LENGTH_S = 0.1
+
+# path: audio to transcribe, time_map: maps its timestamps back to the original file
+VadResult = namedtuple("VadResult", ["path", "time_map", "speech_seconds", "skipped_seconds"])
+
+
+def _runs(mask):
+    """Start and end indices of the runs of True values of a boolean array."""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_speech(energies, frame_length_s=FRAME_LENGTH_S, margin_db=10, max_threshold_db=-40, min_speech_s=0.3, min_silence_s=1.0, padding_s=0.3):
+    """
+    Energy-based voice activity detection, vectorized over all the frames.
+
+    A frame is speech when it is margin_db above the noise floor (10th percentile
+    of the energies), or louder than max_threshold_db so that audio without any
+    pause is not discarded. Pauses shorter than min_silence_s are kept, bursts shorter
+    than min_speech_s are dropped, and every region is padded by padding_s.
+
+    Args:
+        energies (np.ndarray): Frame energies in dB, from frame_energies
+
+    Returns:
+        list: (start, end) speech regions in seconds
+    """
+    if len(energies) == 0:
+        return []
+    threshold = min(np.percentile(energies, 10) + margin_db, max_threshold_db)
+    speech = energies > threshold
+
+    # Fill short pauses
+    starts, ends = _runs(~speech)
+    for start, end in zip(starts, ends):
+        if 0 < start and end < len(speech) and (end - start) * frame_length_s < min_silence_s:
+            speech[start:end] = True
+
+    # Drop short bursts
+    starts, ends = _runs(speech)
+    keep = (ends - starts) * frame_length_s >= min_speech_s
+    starts, ends = starts[keep], ends[keep]
+
+    # Pad and merge the regions that now overlap
+    padding = int(round(padding_s / frame_length_s))
+    starts = np.maximum(starts - padding, 0)
+    ends = np.minimum(ends + padding, len(energies))
+    regions = []
+    for start, end in zip(starts, ends):
+        if regions and start <= regions[-1][1]:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    return [(round(float(start * frame_length_s), 3), round(float(end * frame_length_s), 3)) for start, end in regions]
+
+
+class TimeMap:
+    """
+    Maps timestamps of the condensed (speech only) audio back to the original timeline.
+    """
+
+    def __init__(self, regions):
+        self.regions = [tuple(region) for region in regions]
+        self._condensed_starts = []
+        position = 0.0
+        for start, end in self.regions:
+            self._condensed_starts.append(position)
+            position += end - start
+
+    def remap(self, t, end=False):
+        """
+        Args:
+            t (float): Timestamp in the condensed audio
+            end (bool): Whether t ends a chunk, segment or word: on a boundary between two
+                regions it then maps to the end of the earlier one instead of the start
+                of the next, so it does not stretch over the silence that was cut
+        """
+        if t is None or not self.regions:
+            return t
+        find = bisect.bisect_left if end else bisect.bisect_right
+        i = max(find(self._condensed_starts, t) - 1, 0)
+        start, end = self.regions[i]
+        return round(start + (t - self._condensed_starts[i]), 3)
+
+
+def _speech_blocks(path, regions, sampling_rate=SAMPLING_RATE):
+    """Streams the samples of path that fall inside the regions."""
+    sample_regions = [(int(start * sampling_rate), int(end * sampling_rate)) for start, end in regions]
+    position = 0
+    for block in stream_audio(path, sampling_rate=sampling_rate):
+        block_end = position + len(block)
+        for start, end in sample_regions:
+            if start < block_end and end > position:
+                yield block[max(start - position, 0): min(end, block_end) - position]
+        position = block_end
+
+
+def remove_silence(path, output_path=None):
+    """
+    Writes a copy of path with only its speech regions, next to the source by default.
+    The condensed audio and its regions are reused if they already exist.
+
+    Returns:
+        VadResult: the audio to transcribe, how to remap its timestamps and the seconds skipped
+    """
+    if output_path is None:
+        if path.lower().endswith(".speech.flac") and os.path.exists(path + ".json"):
+            # Already condensed, its timestamps are kept as they are
+            with open(path + ".json", encoding="utf-8") as f:
+                info = json.load(f)
+            speech_seconds = sum(end - start for start, end in info["regions"])
+            return VadResult(path, TimeMap([]), speech_seconds, 0.0)
+        output_path = os.path.splitext(path)[0] + ".speech.flac"
+    regions_path = output_path + ".json"
+
+    if os.path.exists(regions_path) and os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(path):
+        with open(regions_path, encoding="utf-8") as f:
+            info = json.load(f)
+    else:
+        energies = frame_energies(path, frame_length_s=FRAME_LENGTH_S)
+        duration = len(energies) * FRAME_LENGTH_S
+        # Without any detected speech the whole file is kept, better safe than empty
+        regions = detect_speech(energies) or [(0.0, round(duration, 3))]
+        info = {"regions": regions, "duration": duration}
+        write_audio(_speech_blocks(path, regions), output_path)
+        with open(regions_path, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+
+    speech_seconds = sum(end - start for start, end in info["regions"])
+    skipped_seconds = round(info["duration"] - speech_seconds, 1)
+    logging.log(logging.INFO, f"VAD skipped {skipped_seconds}s of {round(info['duration'], 1)}s in {path}")
+    return VadResult(output_path, TimeMap(info["regions"]), speech_seconds, skipped_seconds)
+
+
+def remap_result(result, time_map):
+    """
+    Shifts the timestamps of a transcription of condensed audio back to the
+    original timeline. Works on local results ({"chunks"}) and on API verbose_json
+    (dict or JSON string); plain text is returned as is.
+    """
+    if isinstance(result, str):
+        data = parse_verbose_json(result)
+        if data is None:
+            return result
+        return json.dumps(remap_result(data, time_map), indent=2, default=str)
+
+    result = dict(result)
+    if "chunks" in result:
+        result["chunks"] = [
+            dict(chunk, timestamp=(time_map.remap(chunk["timestamp"][0]), time_map.remap(chunk["timestamp"][1], end=True)))
+            for chunk in result["chunks"]
+        ]
+    for key in ["segments", "words"]:
+        if result.get(key):
+            result[key] = [
+                dict(item, start=time_map.remap(item["start"]), end=time_map.remap(item["end"], end=True))
+                for item in result[key]
+            ]
+    return result
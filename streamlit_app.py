@@ -1,21 +1,30 @@
 import streamlit as st
+import functools
 import os
+import queue
 import tempfile
-import torch
-import requests
-import xml.etree.ElementTree as ET
-import re
-from urllib.parse import urlparse
-from io import BytesIO
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Import your modules
-from src.transcription.api_model import ApiModel
-from src.transcription.local_model import Model
-from src.downloader.downloader import download_mp3_from_youtube, download_podcast_from_podcastindex_url
+from src.transcription.backends import BACKENDS
+from src.transcription.registry import warm_up_from_env
+from src.transcription.service import API_METHOD, caption_result, index_transcript, transcribe_audio
+from src.transcription.streaming import transcribe_while_downloading
+from src.transcripts.store import get_transcript_store
+from src.jobs.worker import get_job_manager
+from src.downloader.downloader import download_audio_from_youtube, download_podcast_from_podcastindex_url
+from src.utils.audio import is_derived_file
+from src.utils.metrics import run_in_context, start_metrics_server_from_env, trace
+from src.utils.subtitles import format_timestamp, result_to_segments, result_to_subtitles
 
 load_dotenv()
 
+# Optionally start loading local models before the first transcription
+warm_up_from_env()
+start_metrics_server_from_env()
+
 # Create folder if it doesn't exist
 if not os.path.exists('./downloads'):
     os.makedirs('./downloads')
@@ -32,6 +41,10 @@ def main():
         "Transcription Method",
         options=["API (Groq)", "Local (Whisper)"]
     )
+    language = None
+    return_text_only = True
+    # Extra, method-specific settings forwarded to transcribe_file
+    options = {}
     
     if transcription_method == "API (Groq)":
         api_key = os.getenv("GROQ_API_KEY")
@@ -53,6 +66,13 @@ def main():
             format_func=lambda x: "Auto-detect" if x is None else x
         )
         return_text_only = st.sidebar.checkbox("Return Text Only", value=True)
+        options["chunked"] = st.sidebar.checkbox(
+            "Split long files",
+            value=False,
+            help="Cut the audio at silences and upload the chunks in parallel"
+        )
+        if options["chunked"]:
+            options["max_workers"] = st.sidebar.slider("Parallel uploads", min_value=1, max_value=8, value=4)
     else:
         model_name = st.sidebar.selectbox(
             "Select Model",
@@ -60,9 +80,47 @@ def main():
             index=0
         )
         st.sidebar.info("Using local Whisper model requires GPU for optimal performance.")
+        options["backend"] = st.sidebar.selectbox(
+            "Inference Backend",
+            options=BACKENDS,
+            index=0,
+            help="int8 and onnx run on CPU and are usually the fastest without a GPU"
+        )
+        options["long_form"] = st.sidebar.checkbox(
+            "Long-form mode",
+            value=True,
+            help="Decode and transcribe the audio in 30 s windows, keeping memory constant for long episodes"
+        )
         
+    options["normalize"] = st.sidebar.checkbox(
+        "Transcode to 16 kHz mono",
+        value=True,
+        help="Convert the audio once to what Whisper uses (Opus for the API, FLAC locally), kept next to the source"
+    )
+    options["vad"] = st.sidebar.checkbox(
+        "Skip silence",
+        value=False,
+        help="Detect speech before transcribing and skip silent parts, timestamps still refer to the original audio"
+    )
+    options["word_timestamps"] = st.sidebar.checkbox(
+        "Word-level timestamps",
+        value=False,
+        help="Time subtitles word by word instead of from whole segments (the API needs 'Return Text Only' disabled)"
+    )
+    options["streaming"] = st.sidebar.checkbox(
+        "Transcribe while downloading",
+        value=False,
+        help="Start transcribing YouTube videos and background podcast jobs before the download is complete, text appears as it is transcribed ('Skip silence' is ignored)"
+    )
+    run_in_background = st.sidebar.checkbox(
+        "Run in background",
+        value=False,
+        help="Queue the work and follow it in the Jobs tab, it keeps running if you leave the page"
+    )
+    job_settings = (transcription_method, model_name, language, return_text_only, options)
+
     # Tabs for different input methods
-    tab1, tab2, tab3, tab4 = st.tabs(["YouTube URL", "Podcast RSS", "Upload Audio", "Saved Files"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["YouTube URL", "Podcast RSS", "Upload Audio", "Saved Files", "Jobs", "Search"])
     
     # YouTube URL tab
     with tab1:
@@ -74,27 +132,67 @@ def main():
             download_btn = st.button("Download & Transcribe", key="youtube_download")
         with col2:
             save_audio = st.checkbox("Save audio file", value=False)
+            caption_policy = st.selectbox(
+                "YouTube captions",
+                options=[None, "manual", "auto"],
+                format_func=lambda x: {None: "Always transcribe the audio", "manual": "Use manual captions if available", "auto": "Use any captions if available"}[x],
+                help="Good captions replace the download and the transcription; the audio is transcribed only when no track passes the policy"
+            )
+        youtube_options = dict(options, captions=caption_policy)
             
-        if download_btn and youtube_url:
+        captions = None
+        if download_btn and youtube_url and run_in_background:
+            job_id = get_job_manager().submit("youtube", youtube_url, transcription_method, model_name, language, return_text_only, youtube_options)
+            st.success(f"Queued job {job_id}, see the Jobs tab")
+        elif download_btn and youtube_url and caption_policy:
+            with st.spinner("Checking YouTube captions..."):
+                try:
+                    caption_stats = {}
+                    captions = caption_result(youtube_url, transcription_method, language, return_text_only, youtube_options, caption_stats)
+                except Exception as e:
+                    st.warning(f"Could not fetch captions: {str(e)}")
+            if captions is not None:
+                index_transcript(captions, youtube_url, kind="youtube", transcription_method=transcription_method, model_name=model_name)
+                st.success(f"Used the '{caption_stats['captions']}' captions, no audio downloaded")
+                show_result(captions, transcription_method, return_text_only)
+            else:
+                st.info("No captions pass the policy, transcribing the audio")
+        if download_btn and youtube_url and not run_in_background and captions is None and options["streaming"]:
+            try:
+                # The file is named before the download starts, the title is not known yet
+                from pytubefix import extract
+
+                if save_audio:
+                    audio_file = os.path.join("downloads", f"{extract.video_id(youtube_url)}.mp3")
+                else:
+                    audio_file = os.path.join(tempfile.mkdtemp(), "audio.mp3")
+            except Exception as e:
+                st.error(f"Invalid YouTube URL: {str(e)}")
+            else:
+                download = functools.partial(download_audio_from_youtube, youtube_url, file_path=audio_file)
+                transcribe_file(audio_file, transcription_method, model_name, language, return_text_only, options, source=youtube_url, kind="youtube", download=download)
+        elif download_btn and youtube_url and not run_in_background and captions is None:
             with st.spinner("Downloading audio from YouTube..."):
                 try:
+                    progress_bar = st.progress(0.0, text="Downloading audio...")
+
+                    def _on_progress(downloaded_size, total_size):
+                        if total_size > 0:
+                            progress_bar.progress(min(downloaded_size / total_size, 1.0), text=f"Downloading audio... {downloaded_size / (1024*1024):.1f} MB")
+
+                    # The audio is streamed straight to disk, never held in memory
                     if save_audio:
-                        # filename = f"downloaded_audio_{hash(youtube_url)}.mp3"
-                        # download_mp3_from_youtube(youtube_url, save_file=True, filename=filename)
-                        audio_file = download_mp3_from_youtube(youtube_url, save_file=True)
-                        file_name = audio_file.split('/')[-1]
+                        audio_file = download_audio_from_youtube(youtube_url, progress_callback=_on_progress)
+                        file_name = os.path.basename(audio_file)
                         st.success(f"Audio saved as {file_name}")
                     else:
-                        audio_bytes = download_mp3_from_youtube(youtube_url)
-                        # Save to temporary file
                         temp_dir = tempfile.mkdtemp()
                         temp_path = os.path.join(temp_dir, "audio.mp3")
-                        with open(temp_path, "wb") as f:
-                            f.write(audio_bytes)
-                        audio_file = temp_path
+                        audio_file = download_audio_from_youtube(youtube_url, file_path=temp_path, progress_callback=_on_progress)
                         st.success("Download complete!")
+                    progress_bar.empty()
                     
-                    transcribe_file(audio_file, transcription_method, model_name, language, return_text_only)
+                    transcribe_file(audio_file, transcription_method, model_name, language, return_text_only, options, source=youtube_url, kind="youtube")
                     
                 except Exception as e:
                     st.error(f"Error downloading from YouTube: {str(e)}")
@@ -131,6 +229,12 @@ def main():
                 if st.button("Download Selected Episodes", key="podcast_download"):
                     if not selected_episodes:
                         st.warning("Please select at least one episode")
+                    elif run_in_background:
+                        selected_indices = [episode_options[ep] for ep in selected_episodes]
+                        for episode in episodes:
+                            if episode["index"] in selected_indices:
+                                job_id = get_job_manager().submit("podcast", episode["url"], *job_settings, title=episode["title"])
+                                st.success(f"Queued job {job_id}: {episode['title']}")
                     else:
                         selected_indices = [episode_options[ep] for ep in selected_episodes]
                         
@@ -158,7 +262,10 @@ def main():
                                             transcription_method, 
                                             model_name, 
                                             language, 
-                                            return_text_only
+                                            return_text_only,
+                                            options,
+                                            title=file_info['title'],
+                                            kind="podcast"
                                         )
                         else:
                             st.error("Failed to download any episodes")
@@ -188,12 +295,17 @@ def main():
             st.audio(uploaded_file)
 
             if st.button("Transcribe Uploaded Audio"):
-                transcribe_file(audio_file_path, transcription_method, model_name, language, return_text_only)
+                if run_in_background:
+                    job_id = get_job_manager().submit("file", audio_file_path, *job_settings, title=uploaded_file.name)
+                    st.success(f"Queued job {job_id}, see the Jobs tab")
+                else:
+                    transcribe_file(audio_file_path, transcription_method, model_name, language, return_text_only, options, title=uploaded_file.name)
 
     with tab4:
 
         def file_selector(folder_path='./downloads'):
-            filenames = os.listdir(folder_path)
+            # Transcoded copies, speech-only audio and unfinished downloads are not offered
+            filenames = [name for name in sorted(os.listdir(folder_path)) if not is_derived_file(name)]
             selected_filename = st.selectbox('Select a file', filenames, index=None)
             if selected_filename is not None:
                 return os.path.join(folder_path, selected_filename)
@@ -201,53 +313,165 @@ def main():
         filename = file_selector()
         if filename is not None:
             st.audio(filename)
-            st.button('Transcribe', on_click= transcribe_file, args=(filename, transcription_method, model_name, language, return_text_only))
+            if run_in_background:
+                st.button('Transcribe', on_click=get_job_manager().submit, args=("file", filename, *job_settings))
+            else:
+                st.button('Transcribe', on_click= transcribe_file, args=(filename, transcription_method, model_name, language, return_text_only, options))
+
+    with tab5:
+        jobs_tab()
+
+    with tab6:
+        search_tab()
+
+
+def jobs_tab():
+    st.header("Background Jobs")
+    manager = get_job_manager()
+    st.button("Refresh", key="jobs_refresh")
+
+    jobs = manager.store.list_jobs()
+    if not jobs:
+        st.info("No jobs yet. Enable 'Run in background' in the sidebar to queue work.")
+        return
+
+    st.dataframe(
+        [{"id": job["id"], "title": job["title"], "status": job["status"], "backend": job["backend"]} for job in jobs],
+        hide_index=True,
+        use_container_width=True
+    )
 
+    job_id = st.selectbox("Show job", options=[job["id"] for job in jobs], format_func=lambda i: f"#{i}")
+    job = manager.store.get(job_id)
+    st.write(f"Status: **{job['status']}**")
+    if job["error"]:
+        st.error(job["error"])
+    if job["stats"]:
+        show_stats(job["stats"])
+    if job["trace"] is not None:
+        show_trace(job["trace"])
+    if job["result"] is not None:
+        show_result(job["result"], job["params"]["transcription_method"], job["params"]["return_text_only"], key=f"job_{job_id}")
 
-def transcribe_file(audio_path, transcription_method, model_name, language=None, return_text_only=True):
+
+def search_tab():
+    st.header("Search Transcripts")
+    store = get_transcript_store()
+    query = st.text_input("Search all transcripts", help='Segments containing all the words are returned, "quotes" match a phrase and a trailing * a prefix')
+    if not query:
+        transcripts = store.list_transcripts()
+        st.info(f"{len(transcripts)} transcripts indexed" if transcripts else "Nothing indexed yet, transcripts are added as they are produced.")
+        return
+
+    start = time.perf_counter()
+    matches = store.search(query, limit=50)
+    st.caption(f"{len(matches)} matches in {(time.perf_counter() - start) * 1000:.0f} ms")
+    for match in matches:
+        timestamp = format_timestamp(match["start"]).split(",")[0] if match["start"] is not None else ""
+        link = match["source"]
+        # YouTube links can jump straight to the match
+        if match["start"] is not None and ("youtube.com" in link or "youtu.be" in link):
+            link += ("&" if "?" in link else "?") + f"t={int(match['start'])}"
+        title = f"[{match['title']}]({link})" if link.startswith("http") else match["title"]
+        st.markdown(f"**{title}** · {timestamp}  \n{match['snippet']}")
+
+
+def transcribe_file(audio_path, transcription_method, model_name, language=None, return_text_only=True, options=None, source=None, title=None, kind="file", download=None):
     try:
-        with st.spinner("Transcribing audio..."):
-            if transcription_method == "API (Groq)":
-                
-                if "GROQ_API_KEY" not in os.environ:
-                    st.error("Please enter your Groq API key in the .env file or set GROQ_API_KEY environment variable.")
-                    return
-                    
-                transcriber = ApiModel(
-                    model_name=model_name,
-                    language=language,
-                    return_text_only=return_text_only
-                )
-                result = transcriber.transcribe(audio_path)
-                
-            else:
-                # Initialize and load the model
-                transcriber = Model(model_name)
-                with st.spinner("Loading Whisper model... This may take a couple of minutes"):
-                    transcriber.load_model()
-                
-                result = transcriber.transcribe([audio_path])
-            
-            # Display results
-            st.success("Transcription complete!")
+        if transcription_method == API_METHOD and "GROQ_API_KEY" not in os.environ:
+            st.error("Please enter your Groq API key in the .env file or set GROQ_API_KEY environment variable.")
+            return
+
+        stats = {}
+        # Partial results arrive from worker threads, the page is only updated from this one
+        partials = queue.Queue()
+        live_text = st.empty()
+        text_so_far = []
+        with st.spinner("Transcribing audio... Loading a local model may take a couple of minutes"), trace("transcribe_file") as file_trace:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                if download is not None:
+                    # Transcribed while download() writes audio_path
+                    future = run_in_context(executor, transcribe_while_downloading, download, audio_path, transcription_method, model_name, language, return_text_only, options, stats, partials.put)
+                else:
+                    future = run_in_context(executor, transcribe_audio, audio_path, transcription_method, model_name, language, return_text_only, options, stats, partials.put)
+                while not future.done() or not partials.empty():
+                    try:
+                        partial = partials.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                    text_so_far.extend(segment["text"] for segment in result_to_segments(partial))
+                    live_text.markdown(" ".join(text_so_far))
+                result = future.result()
+        live_text.empty()
+        # Searchable from the Search tab
+        index_transcript(result, source or audio_path, title, kind, transcription_method, model_name)
             
-            if transcription_method == "API (Groq)" and not return_text_only:
-                st.json(result)
-            else:
-                st.header("Transcription:")
-                st.write(result)
-                
-                # Download button for transcription
-                st.download_button(
-                    label="Download Transcription",
-                    data=result if isinstance(result, str) else str(result),
-                    file_name="transcription.txt",
-                    mime="text/plain"
-                )
+        # Display results
+        st.success("Transcription complete!")
+        show_stats(stats)
+        show_trace(file_trace.to_dict())
+        show_result(result, transcription_method, return_text_only)
     
     except Exception as e:
         st.error(f"Error during transcription: {str(e)}")
         st.info("If using the local model, make sure you have sufficient GPU memory.")
 
+def show_stats(stats):
+    if "captions" in stats:
+        st.info(f"Used the '{stats['captions']}' captions, no audio downloaded")
+    if "transcode_saved_bytes" in stats:
+        saved_mb = stats["transcode_saved_bytes"] / (1024*1024)
+        original_mb = stats["transcode_original_bytes"] / (1024*1024)
+        st.info(f"Transcoded to 16 kHz mono in {stats['transcode_seconds']:.1f}s: {saved_mb:.1f} MB saved of {original_mb:.1f} MB")
+    if "vad_skipped_seconds" in stats:
+        st.info(f"Skipped {stats['vad_skipped_seconds']:.0f}s of silence")
+    if "first_partial_seconds" in stats:
+        st.info(f"First text after {stats['first_partial_seconds']:.1f}s, while the audio was downloading")
+
+def show_trace(trace_dict):
+    with st.expander(f"Timings ({trace_dict['seconds']:.1f}s)"):
+        st.dataframe(
+            [{"stage": span["stage"], "seconds": span["seconds"], "bytes": span.get("bytes"), "audio seconds": span.get("audio_seconds"), "peak RSS (MB)": span["peak_rss_bytes"] / (1024*1024) if span.get("peak_rss_bytes") else None} for span in trace_dict["spans"]],
+            hide_index=True,
+            use_container_width=True
+        )
+
+def show_result(result, transcription_method, return_text_only, key=None):
+    if transcription_method == API_METHOD and not return_text_only:
+        st.json(result)
+    else:
+        st.header("Transcription:")
+        st.write(result)
+        
+        # Download button for transcription
+        st.download_button(
+            label="Download Transcription",
+            data=result if isinstance(result, str) else result["text"],
+            file_name="transcription.txt",
+            mime="text/plain",
+            key=key
+        )
+
+    # Subtitles need timestamps, which a text-only API result does not have
+    segments = result_to_segments(result)
+    if segments and segments[0]["start"] is not None:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="Download SRT",
+                data=result_to_subtitles(result, "srt"),
+                file_name="transcription.srt",
+                mime="application/x-subrip",
+                key=f"{key}_srt" if key else None
+            )
+        with col2:
+            st.download_button(
+                label="Download WebVTT",
+                data=result_to_subtitles(result, "vtt"),
+                file_name="transcription.vtt",
+                mime="text/vtt",
+                key=f"{key}_vtt" if key else None
+            )
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
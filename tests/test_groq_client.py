@@ -0,0 +1,84 @@
+import time
+
+import groq
+import pytest
+
+from benchmarks.stubs import StubServer
+from src.transcription import groq_client
+from src.transcription.groq_client import TokenBucket, call_with_retries
+
+
+@pytest.fixture
+def client_for(monkeypatch):
+    """Points the pooled client to a stub server."""
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+
+    def _client_for(stub):
+        groq_client.reset_client()
+        return groq_client.get_client(base_url=stub.base_url)
+
+    yield _client_for
+    groq_client.reset_client()
+
+
+def _transcribe(client):
+    return client.audio.transcriptions.create(file=("clip.flac", b"audio"), model="whisper-large-v3", response_format="verbose_json")
+
+
+def test_rate_limit_waits_for_retry_after(client_for):
+    with StubServer(api_latency_s=0, error_statuses=[429, 429], retry_after_s=0.3) as stub:
+        client = client_for(stub)
+        start = time.monotonic()
+        # The backoff alone would retry almost at once
+        result = call_with_retries(lambda: _transcribe(client), base_delay=0.001)
+        elapsed = time.monotonic() - start
+    assert result.text == "stub transcription"
+    assert stub.api_requests == 3
+    assert elapsed >= 0.6
+
+
+def test_server_errors_back_off_exponentially(client_for, monkeypatch):
+    # The largest delay of the full jitter range
+    monkeypatch.setattr(groq_client.random, "uniform", lambda low, high: high)
+    with StubServer(api_latency_s=0, error_statuses=[503, 500]) as stub:
+        client = client_for(stub)
+        start = time.monotonic()
+        result = call_with_retries(lambda: _transcribe(client), base_delay=0.1)
+        elapsed = time.monotonic() - start
+    assert result.text == "stub transcription"
+    assert stub.api_requests == 3
+    assert elapsed >= 0.1 + 0.2
+
+
+def test_gives_up_after_the_last_retry(client_for):
+    with StubServer(api_latency_s=0, rate_limit_every=1, retry_after_s=0) as stub:
+        client = client_for(stub)
+        with pytest.raises(groq.RateLimitError):
+            call_with_retries(lambda: _transcribe(client), max_retries=2)
+    assert stub.api_requests == 3
+
+
+def test_client_errors_are_not_retried(client_for):
+    with StubServer(api_latency_s=0, error_statuses=[400]) as stub:
+        client = client_for(stub)
+        with pytest.raises(groq.BadRequestError):
+            call_with_retries(lambda: _transcribe(client))
+    assert stub.api_requests == 1
+
+
+def test_token_bucket_paces_requests_after_the_burst(client_for):
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    def _request():
+        bucket.acquire()
+        return _transcribe(client)
+
+    with StubServer(api_latency_s=0) as stub:
+        client = client_for(stub)
+        start = time.monotonic()
+        for _ in range(4):
+            call_with_retries(_request)
+        elapsed = time.monotonic() - start
+    assert stub.api_requests == 4
+    # 2 requests from the full bucket, then one every 0.1s
+    assert 0.2 <= elapsed < 1.0
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+from benchmarks.import_time import BUDGET, ENTRY_POINTS, forbidden_modules, measure
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", list(ENTRY_POINTS))
+def test_entry_point_imports_within_budget(module, monkeypatch):
+    # The child interpreter imports the entry point from the repository root
+    monkeypatch.chdir(ROOT)
+    result = measure(module, forbidden_modules(module))
+    assert "error" not in result, result.get("error")
+    assert result["loaded"] == []
+    assert result["seconds"] <= BUDGET, result["slowest"]